@@ -0,0 +1,302 @@
+"""Local stand-ins for YouTube, iTunes/Deezer and the Discord voice connection."""
+import asyncio
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import os
+import discord
+from aiohttp import web
+
+FRAME_SIZE = 3840 # 20 ms of 48 kHz stereo s16le, what discord.py reads per frame
+
+
+class FakeYoutubeDL:
+    """Drop-in for yt_dlp.YoutubeDL that returns canned info dicts after `delay` seconds.
+
+    URLs containing "playlist" return a flat playlist of `playlist_size` entries,
+    "ytsearch" queries a one-entry flat result; anything else returns a fully resolved video pointing at `stream_url`.
+    """
+    delay = 0.3
+    playlist_size = 200
+    stream_url = None
+    calls = 0
+
+    def __init__(self, options=None):
+        self.params = dict(options or {})
+
+    @staticmethod
+    def video_id(n):
+        return f"bench{n:06d}"
+
+    @classmethod
+    def flat_entry(cls, n):
+        video_id = cls.video_id(n)
+        return {
+            '_type': 'url',
+            'ie_key': 'Youtube',
+            'id': video_id,
+            'url': f"https://www.youtube.com/watch?v={video_id}",
+            'title': f"Bench Artist - Bench Song {n} (Official Video)",
+            'duration': 180 + n % 120,
+            'uploader': "Bench Artist",
+            'channel': "Bench Artist",
+            'channel_url': "https://www.youtube.com/channel/UCbench",
+            'thumbnails': [{'url': f"https://i.ytimg.com/vi/{video_id}/hq{i}.jpg", 'height': 90 * i, 'width': 160 * i} for i in range(4)],
+            'view_count': 1000 * n,
+        }
+
+    def _full_info(self, url):
+        video_id = url.rsplit('v=', 1)[-1][:11]
+        n = int(video_id[5:]) if video_id.startswith('bench') else 0
+        info = self.flat_entry(n)
+        info.pop('_type')
+        info.pop('ie_key')
+        expire = int(time.time()) + 6 * 3600
+        info.update({
+            'webpage_url': f"https://www.youtube.com/watch?v={video_id}",
+            'extractor_key': 'Youtube',
+            'acodec': 'opus',
+            'url': f"{self.stream_url}?expire={expire}&id={video_id}",
+            'formats': [
+                {'format_id': str(i), 'url': f"{self.stream_url}?itag={i}", 'acodec': 'opus', 'abr': 48 + i * 8,
+                 'http_headers': {'User-Agent': 'bench', 'Accept': '*/*'}}
+                for i in range(24)
+            ],
+        })
+        return info
+
+    def extract_info(self, url, download=False, process=True):
+        FakeYoutubeDL.calls += 1
+        time.sleep(self.delay)
+        if 'playlist' in url:
+            size = self.playlist_size
+            return {
+                '_type': 'playlist',
+                'title': "Bench Playlist",
+                'entries': (self.flat_entry(n) for n in range(size)),
+            }
+        if url.startswith('ytsearch'):
+            n = sum(map(ord, url)) % 100000
+            return {'_type': 'playlist', 'title': url, 'entries': iter([self.flat_entry(n)])}
+        return self._full_info(url)
+
+    def prepare_filename(self, info):
+        return f"{info['id']}.opus"
+
+
+class SyntheticAudio(discord.AudioSource):
+    """Silent PCM source used when FFmpeg is not installed."""
+
+    def __init__(self, frames):
+        self.remaining = frames
+
+    def read(self):
+        if self.remaining <= 0:
+            return b''
+        self.remaining -= 1
+        return b'\x00' * FRAME_SIZE
+
+    def is_opus(self):
+        return False
+
+
+class FakeVoiceClient:
+    """Consumes frames from a source on its own thread, paced like discord.py's audio player."""
+
+    def __init__(self, frame_interval=0.02):
+        self.frame_interval = frame_interval
+        self._thread = None
+        self._stop = threading.Event()
+        self._paused = False
+        self.tracks = [] # (play_called_at, first_frame_at, ended_at, frames)
+        self.first_frame = threading.Event()
+
+    def is_connected(self):
+        return True
+
+    def is_playing(self):
+        return self._thread is not None and self._thread.is_alive() and not self._paused
+
+    def is_paused(self):
+        return self._paused
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    def stop(self):
+        # Like discord.py, the client is free to play again right away; the old thread winds down alone
+        self._stop.set()
+        self._thread = None
+        self._paused = False
+
+    async def disconnect(self, *, force=False):
+        self.stop()
+
+    def play(self, source, *, after=None):
+        if self._thread is not None and self._thread.is_alive():
+            raise discord.ClientException('Already playing audio.')
+        self._stop = threading.Event()
+        self.first_frame.clear()
+        record = [time.perf_counter(), None, None, 0]
+        self.tracks.append(record)
+        self._thread = threading.Thread(target=self._run, args=(source, after, record, self._stop), daemon=True)
+        self._thread.start()
+
+    def _run(self, source, after, record, stop):
+        error = None
+        try:
+            while not stop.is_set():
+                if self._paused:
+                    time.sleep(self.frame_interval)
+                    continue
+                data = source.read()
+                if not data:
+                    break
+                if record[1] is None:
+                    record[1] = time.perf_counter()
+                    self.first_frame.set()
+                record[3] += 1
+                if self.frame_interval:
+                    time.sleep(self.frame_interval)
+        except Exception as e:
+            error = e
+        finally:
+            source.cleanup()
+            record[2] = time.perf_counter()
+        if after:
+            after(error)
+
+
+def _echo_term(request, name):
+    return request.query.get(name, '')
+
+
+class FakeProviders:
+    """Local aiohttp server imitating the iTunes, Deezer and Spotify Web APIs and serving a test stream.
+
+    Spotify playlists and albums have `spotify_size` tracks, served in API-sized pages.
+    """
+
+    def __init__(self, delay=0.1, audio_path=None, spotify_size=200):
+        self.delay = delay
+        self.audio_path = audio_path
+        self.spotify_size = spotify_size
+        self.requests = 0
+        self._runner = None
+        self.base_url = None
+
+    async def _itunes(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        term = _echo_term(request, 'term')
+        return web.json_response({'resultCount': 1, 'results': [{
+            'trackName': term,
+            'artistName': term,
+            'artworkUrl100': "https://is1-ssl.mzstatic.com/image/thumb/bench/100x100bb.jpg",
+        }]}, content_type='text/javascript')
+
+    async def _deezer(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        term = _echo_term(request, 'q')
+        return web.json_response({'data': [{
+            'title': term,
+            'artist': {'name': term},
+            'album': {'cover_xl': "https://e-cdns-images.dzcdn.net/images/cover/bench/1000x1000.jpg"},
+        }]})
+
+    async def _spotify_token(self, request):
+        return web.json_response({'access_token': "bench", 'token_type': "Bearer", 'expires_in': 3600})
+
+    @staticmethod
+    def _spotify_track(n):
+        return {
+            'id': f"benchtrack{n:06d}",
+            'name': f"Bench Song {n}",
+            'duration_ms': (180 + n % 120) * 1000,
+            'artists': [{'name': "Bench Artist"}],
+            'album': {'images': [{'url': "https://i.scdn.co/image/bench"}]},
+        }
+
+    def _spotify_page(self, request, wrap):
+        offset = int(request.query.get('offset', 0))
+        limit = int(request.query.get('limit', 50))
+        end = min(offset + limit, self.spotify_size)
+        items = [wrap(self._spotify_track(n)) for n in range(offset, end)]
+        next_url = None
+        if end < self.spotify_size:
+            next_url = str(request.url.update_query({'offset': end, 'limit': limit}))
+        return {'items': items, 'next': next_url, 'total': self.spotify_size}
+
+    async def _spotify_playlist(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        return web.json_response({'name': "Bench Spotify Playlist"})
+
+    async def _spotify_playlist_items(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        page = self._spotify_page(request, lambda track: {'track': track})
+        return web.json_response(page)
+
+    async def _spotify_album(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        return web.json_response({'name': "Bench Spotify Album", 'images': [{'url': "https://i.scdn.co/image/bench"}]})
+
+    async def _spotify_album_tracks(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        page = self._spotify_page(request, lambda track: {k: v for k, v in track.items() if k != 'album'})
+        return web.json_response(page)
+
+    async def _spotify_single(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        return web.json_response(self._spotify_track(0))
+
+    async def _audio(self, request):
+        return web.FileResponse(self.audio_path)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/itunes/search', self._itunes)
+        app.router.add_get('/deezer/search', self._deezer)
+        app.router.add_post('/spotify/token', self._spotify_token)
+        app.router.add_get('/spotify/v1/playlists/{id}', self._spotify_playlist)
+        app.router.add_get('/spotify/v1/playlists/{id}/tracks', self._spotify_playlist_items)
+        app.router.add_get('/spotify/v1/playlists/{id}/items', self._spotify_playlist_items)
+        app.router.add_get('/spotify/v1/albums/{id}', self._spotify_album)
+        app.router.add_get('/spotify/v1/albums/{id}/tracks', self._spotify_album_tracks)
+        app.router.add_get('/spotify/v1/tracks/{id}', self._spotify_single)
+        if self.audio_path:
+            app.router.add_get('/audio.ogg', self._audio)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+def make_test_audio(seconds):
+    """Generate a short Ogg/Opus file with FFmpeg. Returns its path, or None without FFmpeg."""
+    if not shutil.which('ffmpeg'):
+        return None
+    path = os.path.join(tempfile.mkdtemp(prefix='lyra-bench-'), 'tone.ogg')
+    subprocess.run(
+        ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi', '-i', f"sine=frequency=440:duration={seconds}",
+         '-ac', '2', '-ar', '48000', '-c:a', 'libopus', '-b:a', '96k', path],
+        check=True,
+    )
+    return path
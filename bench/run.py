@@ -0,0 +1,253 @@
+"""Offline benchmark for the enqueue-to-audio pipeline.
+
+Swaps yt-dlp, the iTunes/Deezer/Spotify APIs and the Discord voice connection for local
+stand-ins (see bench/fakes.py) and prints a JSON report, so runs on different
+commits or machines can be diffed:
+
+    python -m bench.run --output before.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import config
+import utils.extractor
+from utils.audio import YTDLSource, LazySource, extraction_pool
+from utils.cache import resolution_cache
+from utils.metadata_cache import metadata_cache
+from utils.player import GuildPlayer
+from utils import spotify
+from utils.track_queue import TrackQueue
+from utils import http
+from bench.fakes import FakeYoutubeDL, FakeVoiceClient, FakeProviders, SyntheticAudio, make_test_audio
+
+TRACK_SECONDS = 1
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    return {
+        'n': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+        'p50_ms': round(samples[len(samples) // 2] * 1000, 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        'min_ms': round(samples[0] * 1000, 3),
+        'max_ms': round(samples[-1] * 1000, 3),
+    }
+
+
+def install_fakes(providers, audio_path):
+    utils.extractor.load_yt_dlp().YoutubeDL = FakeYoutubeDL
+    config.ITUNES_SEARCH_URL = f"{providers.base_url}/itunes/search"
+    config.DEEZER_SEARCH_URL = f"{providers.base_url}/deezer/search"
+    config.SPOTIFY_CLIENT_ID = config.SPOTIFY_CLIENT_SECRET = "bench"
+    config.JOURNAL_ENABLED = False
+    # Synthetic tracks end long before their reported duration; that's not a dropped stream
+    config.STREAM_RESUME_ATTEMPTS = 0
+    config.SPOTIFY_API_URL = f"{providers.base_url}/spotify/v1/"
+    config.SPOTIFY_TOKEN_URL = f"{providers.base_url}/spotify/token"
+    metadata_cache.path = os.path.join(tempfile.mkdtemp(prefix='lyra-bench-'), 'metadata.db')
+    spotify.match_cache.path = metadata_cache.path
+    FakeYoutubeDL.stream_url = f"{providers.base_url}/audio.ogg"
+    if not audio_path:
+        # No FFmpeg here: feed the voice client silent frames instead of spawning it
+        frames = TRACK_SECONDS * 50
+        YTDLSource.open_audio = classmethod(lambda cls, path, data, start_at=0: SyntheticAudio(frames))
+
+
+async def wait_first_frame(voice_client, timeout=30):
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(None, voice_client.first_frame.wait, timeout):
+        raise TimeoutError("No audio frame received")
+
+
+async def bench_time_to_first_audio(iterations):
+    """create_source -> first frame consumed, for a cold and a warm (cached) link, and a playlist."""
+    results = {'single_cold': [], 'single_warm': [], 'playlist_cold': []}
+    for i in range(iterations):
+        url = f"https://www.youtube.com/watch?v={FakeYoutubeDL.video_id(10000 + i)}"
+        playlist = f"https://www.youtube.com/playlist?list=bench{i}"
+        for key, link in (('single_cold', url), ('single_warm', url), ('playlist_cold', playlist)):
+            if key == 'playlist_cold':
+                resolution_cache.clear()
+            voice_client = FakeVoiceClient()
+            started = time.perf_counter()
+            sources = await YTDLSource.create_source(
+                link, requester_id=1, on_ingest=lambda ingest: ingest.pages.release(ingest)
+            )
+            voice_client.play(sources[0])
+            await wait_first_frame(voice_client)
+            results[key].append(time.perf_counter() - started)
+            voice_client.stop()
+    return {key: summarize(samples) for key, samples in results.items()}
+
+
+async def bench_track_change(tracks, prefetch_count, id_offset):
+    """Gap between one track's last frame and the next track's first frame in GuildPlayer."""
+    config.PREFETCH_COUNT = prefetch_count
+    loop = asyncio.get_running_loop()
+    cog = SimpleNamespace(bot=SimpleNamespace(loop=loop), view=None, release_player=lambda player: None)
+    player = GuildPlayer(cog, guild_id=0)
+    voice_client = FakeVoiceClient()
+    player.voice_client = voice_client
+    await player.enqueue(LazySource(FakeYoutubeDL.flat_entry(id_offset + n), 1) for n in range(tracks))
+    deadline = time.monotonic() + tracks * (TRACK_SECONDS + FakeYoutubeDL.delay + 5)
+    while not (len(voice_client.tracks) == tracks and voice_client.tracks[-1][2]):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Only {len(voice_client.tracks)}/{tracks} tracks played")
+        await asyncio.sleep(0.02)
+
+    played = voice_client.tracks
+    gaps = [played[i + 1][1] - played[i][2] for i in range(len(played) - 1)]
+    return summarize(gaps)
+
+
+async def bench_spotify(providers):
+    """Spotify playlist link -> first source and -> every track queued, with a cold and a warm match cache."""
+    results = {}
+    for key in ('cold', 'warm'):
+        ingests = []
+        queued = []
+        requests_before = providers.requests
+        started = time.perf_counter()
+        sources = await spotify.create_spotify_source(
+            "https://open.spotify.com/playlist/bench", requester_id=1, on_ingest=ingests.append
+        )
+        first = time.perf_counter() - started
+
+        async def on_page(page):
+            queued.extend(page)
+        await ingests[0].run(on_page)
+        results[key] = {
+            'tracks': len(sources) + len(queued),
+            'first_source_ms': round(first * 1000, 3),
+            'fully_queued_ms': round((time.perf_counter() - started) * 1000, 3),
+            'spotify_requests': providers.requests - requests_before,
+        }
+    results['match_concurrency'] = config.SPOTIFY_MATCH_CONCURRENCY
+    return results
+
+
+def bench_dashboard(sizes, repeats):
+    """create_dashboard_embed cost against queue size, with and without the Up Next cache."""
+    cog = SimpleNamespace(bot=SimpleNamespace(loop=None), view=None, release_player=lambda player: None)
+    results = []
+    for size in sizes:
+        player = GuildPlayer(cog, guild_id=0)
+        player.current_track = LazySource(FakeYoutubeDL.flat_entry(0), 1)
+        player.queue.extend(LazySource(FakeYoutubeDL.flat_entry(n), 1) for n in range(size))
+
+        cold = []
+        for _ in range(repeats):
+            player._up_next_cache = (None, None)
+            started = time.perf_counter()
+            player.create_dashboard_embed()
+            cold.append(time.perf_counter() - started)
+
+        warm = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            player.create_dashboard_embed()
+            warm.append(time.perf_counter() - started)
+
+        results.append({'queue_size': size, 'cold': summarize(cold), 'warm': summarize(warm)})
+    return results
+
+
+def bench_memory(count):
+    """Bytes held per queued (unresolved) track, including the queue itself."""
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    queue = TrackQueue(LazySource(FakeYoutubeDL.flat_entry(n), 1) for n in range(count))
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del queue
+    return {'tracks': count, 'bytes_per_track': round((after - before) / count, 1)}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+async def main(args):
+    FakeYoutubeDL.delay = args.extract_delay
+    audio_path = make_test_audio(TRACK_SECONDS)
+    providers = await FakeProviders(delay=args.http_delay, audio_path=audio_path).start()
+    install_fakes(providers, audio_path)
+
+    try:
+        report = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'revision': git_revision(),
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'ffmpeg': bool(audio_path),
+                'extract_delay_s': args.extract_delay,
+                'http_delay_s': args.http_delay,
+                'extract_workers': extraction_pool.size,
+                'extract_mode': extraction_pool.mode,
+            },
+            'time_to_first_audio': await bench_time_to_first_audio(args.iterations),
+            'track_change_gap': {
+                'no_prefetch': await bench_track_change(args.tracks, 0, id_offset=20000),
+                'prefetch': await bench_track_change(args.tracks, 1, id_offset=30000),
+            },
+            'spotify_playlist': await bench_spotify(providers),
+            'dashboard_render': bench_dashboard(args.sizes, args.render_repeats),
+            'memory': bench_memory(args.memory_tracks),
+            'counters': {
+                'extract_calls': FakeYoutubeDL.calls,
+                'provider_requests': providers.requests,
+                'resolution_cache': resolution_cache.stats(),
+                'metadata_cache': metadata_cache.stats(),
+            },
+        }
+    finally:
+        await providers.stop()
+        await http.close_session()
+        metadata_cache.close()
+        spotify.match_cache.close()
+        extraction_pool.shutdown()
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=5, help="time-to-first-audio samples per case")
+    parser.add_argument('--tracks', type=int, default=6, help="tracks played per track-change run")
+    parser.add_argument('--extract-delay', type=float, default=0.3, help="seconds per fake extract_info call")
+    parser.add_argument('--http-delay', type=float, default=0.1, help="seconds per fake provider response")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[0, 10, 100, 1000, 5000], help="queue sizes for the render benchmark")
+    parser.add_argument('--render-repeats', type=int, default=50)
+    parser.add_argument('--memory-tracks', type=int, default=5000)
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    # Keep stdout clean for the JSON report; the bot's own logging goes to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(main(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
@@ -2,10 +2,16 @@ import discord
 from discord.ext import commands, tasks
 from discord.ui import View, Button
 import config
-from utils.audio import YTDLSource, resolve_spotify_url
+from utils.audio import YTDLSource
+from utils.spotify import parse_spotify_url, create_spotify_source
+from utils.player import GuildPlayer
+from utils.journal import QueueJournal
+from utils.dashboard import load_dashboard_ids, save_dashboard_id
+from utils.cluster import shard_for
 import asyncio
 import traceback
 import time
+import os
 
 class DashboardView(View):
     def __init__(self, cog):
@@ -28,141 +34,184 @@ class DashboardView(View):
     async def shuffle(self, interaction: discord.Interaction, button: Button):
         await self.cog.shuffle_queue(interaction)
 
+    @discord.ui.button(label="🔁 Loop", style=discord.ButtonStyle.secondary, custom_id="lyra:loop", row=1)
+    async def loop(self, interaction: discord.Interaction, button: Button):
+        await self.cog.cycle_loop(interaction)
+
+    @discord.ui.button(label=f"⏪ -{config.SEEK_STEP}s", style=discord.ButtonStyle.secondary, custom_id="lyra:seek_back", row=1)
+    async def seek_back(self, interaction: discord.Interaction, button: Button):
+        await self.cog.seek(interaction, -config.SEEK_STEP)
+
+    @discord.ui.button(label=f"⏩ +{config.SEEK_STEP}s", style=discord.ButtonStyle.secondary, custom_id="lyra:seek_forward", row=1)
+    async def seek_forward(self, interaction: discord.Interaction, button: Button):
+        await self.cog.seek(interaction, config.SEEK_STEP)
+
+    @discord.ui.button(label="✖️ Cancel Loading", style=discord.ButtonStyle.secondary, custom_id="lyra:cancel_ingest", row=1)
+    async def cancel_ingest(self, interaction: discord.Interaction, button: Button):
+        await self.cog.cancel_ingest(interaction)
+
 
 
 class MusicCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.queue = []
-        self.current_track = None
-        self.voice_client = None
-        self.dashboard_message = None
-        self.dashboard_channel = None
-        self.loop_mode = 0 # 0=Off, 1=Track, 2=Queue
-        self.start_time = 0
-        self.manual_skip = False
+        self.players = {} # guild_id -> GuildPlayer
+        self.music_channel_ids = set(config.MUSIC_CHANNEL_IDS)
+        self.view = None # Persistent view shared by every dashboard
+        self.restored = False
+        self.dashboard_ids = load_dashboard_ids(config.DASHBOARD_IDS_PATH) # channel_id -> message_id
 
     async def cog_load(self):
-        self.bot.add_view(DashboardView(self))
+        self.view = DashboardView(self)
+        self.bot.add_view(self.view)
+        if config.JOURNAL_ENABLED:
+            self.checkpoint_positions.start()
+
+    async def cog_unload(self):
+        # Freeze the journals before shutdown stops the voice clients (and advances the queues)
+        self.checkpoint_positions.cancel()
+        for player in self.players.values():
+            player.checkpoint()
+            if player.journal:
+                player.journal.close()
+
+    @tasks.loop(seconds=config.JOURNAL_CHECKPOINT_INTERVAL)
+    async def checkpoint_positions(self):
+        for player in list(self.players.values()):
+            player.checkpoint()
+
+    def get_player(self, guild_id):
+        player = self.players.get(guild_id)
+        if player is None:
+            player = GuildPlayer(self, guild_id)
+            self.players[guild_id] = player
+        return player
+
+    def release_player(self, player):
+        # Players bound to a dashboard stay registered; ad-hoc ones are dropped once idle
+        if player.dashboard_channel is None and player.is_idle:
+            self.players.pop(player.guild_id, None)
+            player.close()
 
     @commands.Cog.listener()
     async def on_ready(self):
-        await self.setup_dashboard()
-
-    async def setup_dashboard(self):
+        await self.setup_dashboards()
+        self.bot.mark_startup("dashboards ready")
+        await self.restore_players()
+        self.bot.mark_startup("players restored")
+
+    async def restore_players(self):
+        """Bring back the queues journaled before the last restart (once per process)."""
+        if self.restored or not config.JOURNAL_ENABLED or not os.path.isdir(config.JOURNAL_DIR):
+            return
+        self.restored = True
+        started = time.perf_counter()
+
+        restores = []
+        for name in os.listdir(config.JOURNAL_DIR):
+            if not name.endswith('.jsonl'):
+                continue
+            path = os.path.join(config.JOURNAL_DIR, name)
+            try:
+                guild_id = int(name[:-len('.jsonl')])
+                # Not ours (left, or run by another cluster worker): leave its journal alone
+                if self.bot.get_guild(guild_id) is None:
+                    continue
+                state = QueueJournal.load(path)
+            except Exception as e:
+                print(f"⚠️ Skipping unreadable journal {name}: {e}")
+                continue
+            if not state or not (state['current'] or state['queue']):
+                os.remove(path)
+                continue
+            restores.append(self.get_player(guild_id).restore(state))
+
+        results = await asyncio.gather(*restores, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"⚠️ Error restoring player: {result}")
+        if restores:
+            print(f"♻️ Restored {len(restores)} player(s) in {time.perf_counter() - started:.1f}s")
+
+    def owns_guild(self, guild_id):
+        """False if the guild belongs to a shard run by another cluster worker."""
+        if self.bot.shard_ids is None or not self.bot.shard_count:
+            return True
+        return shard_for(guild_id, self.bot.shard_count) in self.bot.shard_ids
+
+    async def setup_dashboards(self):
         await self.bot.wait_until_ready()
-        self.dashboard_channel = self.bot.get_channel(config.MUSIC_CHANNEL_ID)
-        
-        if not self.dashboard_channel:
-            print(f"❌ ERROR: Dashboard channel ID {config.MUSIC_CHANNEL_ID} not found! Check permissions or ID.")
+        await asyncio.gather(*(self.setup_dashboard(channel_id) for channel_id in self.music_channel_ids))
+
+    async def setup_dashboard(self, channel_id):
+        channel = self.bot.get_channel(channel_id)
+
+        if not channel and self.bot.shard_ids is not None:
+            # Cluster worker: channels on our shards are cached once ready, the rest belong to other workers
+            return
+
+        if not channel:
+            print(f"❌ ERROR: Dashboard channel ID {channel_id} not found! Check permissions or ID.")
             try:
-                self.dashboard_channel = await self.bot.fetch_channel(config.MUSIC_CHANNEL_ID)
+                channel = await self.bot.fetch_channel(channel_id)
             except Exception as e:
                 print(f"🚨 CRITICAL ERROR: Could not fetch channel: {e}")
                 return
 
+        if not self.owns_guild(channel.guild.id):
+            # Another cluster worker runs this guild and its dashboard
+            return
+
+        player = self.get_player(channel.guild.id)
+        player.dashboard_channel = channel
+
+        # Known dashboard message: a single edit, no history scan
+        message_id = self.dashboard_ids.get(channel_id)
+        if message_id:
+            try:
+                embed = player.create_dashboard_embed()
+                player.dashboard_message = await channel.get_partial_message(message_id).edit(embed=embed, view=self.view)
+                player.renderer.reset(embed=embed, view_sent=True)
+                return
+            except discord.NotFound:
+                print(f"⚠️ Dashboard message {message_id} is gone, looking for another one.")
+            except Exception as e:
+                print(f"⚠️ ERROR: Could not edit dashboard message {message_id}: {e}")
+
         # Find existing dashboard message
-        async for message in self.dashboard_channel.history(limit=10):
+        async for message in channel.history(limit=10):
             if message.author == self.bot.user:
-                self.dashboard_message = message
+                player.dashboard_message = message
                 break
         
-        if not self.dashboard_message:
+        if not player.dashboard_message:
             try:
-                embed = self.create_dashboard_embed()
-                self.dashboard_message = await self.dashboard_channel.send(embed=embed, view=DashboardView(self))
+                embed = player.create_dashboard_embed()
+                player.dashboard_message = await channel.send(embed=embed, view=self.view)
+                player.renderer.reset(embed=embed, view_sent=True)
             except Exception as e:
                 print(f"❌ ERROR: Could not send message: {e}")
         else:
             # Refresh view
-            await self.update_dashboard()
-
-    def create_dashboard_embed(self):
-        embed = discord.Embed(title="Lyra Player 🎵", color=config.COLOR_MAIN)
-        
-        if self.current_track:
-            status = "Now Playing ▶️"
-            if self.voice_client and self.voice_client.is_paused():
-                status = "Paused ⏸️"
-            
-            # Combine info into one main block for symmetry
-            # description = f"**{self.current_track.title}**\n*{self.current_track.uploader}*\n`⏱️ {self.current_track.formatted_duration}`"
-            # embed.add_field(name=status, value=description, inline=False)
-            
-            requester = self.current_track.requester.mention if self.current_track.requester else "Unknown"
-            
-            # Title and Artist
-            description = f"**{self.current_track.title}**\n*{self.current_track.uploader}*"
-            embed.add_field(name=status, value=description, inline=False)
-            
-            # Inline fields for Duration and Requester
-            embed.add_field(name="Duration", value=self.current_track.formatted_duration, inline=True)
-            embed.add_field(name="Requested by", value=requester, inline=True)
-            
-            if self.current_track.thumbnail:
-                embed.set_thumbnail(url=self.current_track.thumbnail)
-        else:
-            embed.description = "No track playing. Paste a link to start!"
-            embed.add_field(name="Status", value="Idle", inline=False)
-
-        if self.queue:
-            # Calculate total queue duration
-            total_seconds = sum(int(t.duration) for t in self.queue if t.duration)
-            m, s = divmod(total_seconds, 60)
-            h, m = divmod(m, 60)
-            if h > 0:
-                total_duration = f"{h}h {m}m"
-            else:
-                total_duration = f"{m}m {s}s"
-
-            queue_list = []
-            for i, t in enumerate(self.queue[:10]):
-                req = t.requester.mention if t.requester else "Unknown"
-                title = t.title
-                if len(title) > 30:
-                    title = title[:27] + "..."
-                queue_list.append(f"`{i+1}.` **{title}** ({t.formatted_duration}) • {req}")
-            
-            up_next = "\n".join(queue_list)
-            if len(self.queue) > 10:
-                up_next += f"\n\n**+ {len(self.queue)-10} more tracks in queue...**"
-            
-
-            embed.add_field(name=f"Up Next (Total: {total_duration})", value=up_next, inline=False)
-            
-            # Footer info (Total Queue Duration only)
-            # embed.set_footer(text=f"Total Queue Duration: {total_duration}")
-        
-        return embed
-
-    async def update_dashboard(self):
-        if self.dashboard_message:
-            try:
-                embed = self.create_dashboard_embed()
-                view = DashboardView(self)
-                
+            player.renderer.reset()
+            await player.update_dashboard()
 
-
-                await self.dashboard_message.edit(embed=embed, view=view)
-            except Exception as e:
-                print(f"⚠️ ERROR in update_dashboard: {e}")
-
-    async def send_notification(self, text, color=config.COLOR_MAIN, delete_after=10):
-        if self.dashboard_channel:
-            try:
-                embed = discord.Embed(description=text, color=color)
-                await self.dashboard_channel.send(embed=embed, delete_after=delete_after)
-            except Exception as e:
-                print(f"⚠️ Error sending notification: {e}")
+        if player.dashboard_message:
+            self.dashboard_ids[channel_id] = player.dashboard_message.id
+            save_dashboard_id(config.DASHBOARD_IDS_PATH, channel_id, player.dashboard_message.id)
 
     @commands.Cog.listener()
     async def on_message(self, message):
-        if message.author.bot:
+        if message.author.bot or message.guild is None:
             return
         
-        if message.channel.id != config.MUSIC_CHANNEL_ID:
+        if message.channel.id not in self.music_channel_ids:
             return
 
+        player = self.get_player(message.guild.id)
+        if player.dashboard_channel is None:
+            player.dashboard_channel = message.channel
+
         # Delete user message
         try:
             await message.delete()
@@ -179,31 +228,36 @@ class MusicCog(commands.Cog):
             msg = await message.channel.send(f"{message.author.mention}, Lyra only accepts links here.", delete_after=5)
             return
 
-        # Resolve URL (Spotify -> Search Query)
-        query = resolve_spotify_url(url)
-        
         # Join voice if not connected
-        if not self.voice_client or not self.voice_client.is_connected():
-            self.voice_client = await message.author.voice.channel.connect()
+        if not player.voice_client or not player.voice_client.is_connected():
+            await player.connect(message.author.voice.channel, message.channel)
 
         # Add to queue
-        search_msg = await message.channel.send(f"🔎 **Searching for:** `{query}`...")
+        search_msg = await message.channel.send(f"🔎 **Searching for:** `{url}`...")
         
+        ingests = []
         try:
-            sources = await YTDLSource.create_source(query, loop=self.bot.loop, requester=message.author)
-            self.queue.extend(sources)
-            
+            if parse_spotify_url(url):
+                # Spotify -> matched YouTube tracks
+                sources = await create_spotify_source(url, requester_id=message.author.id, on_ingest=ingests.append, bitrate=player.bitrate)
+            else:
+                sources = await YTDLSource.create_source(url, loop=self.bot.loop, requester_id=message.author.id, on_ingest=ingests.append, bitrate=player.bitrate)
+
+            # The first track goes in before the rest of its playlist starts streaming in
+            await player.enqueue(sources)
+            for ingest in ingests:
+                player.start_ingest(ingest)
+            ingests = []
+
             # Delete search message when found
             try: await search_msg.delete()
             except: pass
-
-            if not self.voice_client.is_playing():
-                self.play_next()
-            else:
-                print(f"📚 Added to queue: {sources[0].title} (Queue size: {len(self.queue)})")
-                await self.update_dashboard()
         except Exception as e:
             traceback.print_exc()
+            for ingest in ingests:
+                # Cancelled before it starts, so it just releases its page reader
+                ingest.cancel()
+                player.start_ingest(ingest)
             try: await search_msg.delete()
             except: pass
 
@@ -218,176 +272,78 @@ class MusicCog(commands.Cog):
             else:
                 await message.channel.send(f"Error processing request: {str(e)}", delete_after=10)
 
-    def play_next(self):
-        print("🐛 Checking queue...")
-        
-        # Loop Track Logic
-        if self.loop_mode == 1 and self.current_track:
-            # Handled in after_play
-            pass 
-
-        if self.queue:
-            # Get next track
-            next_track = self.queue.pop(0)
-            
-            # Check if it's a LazySource and resolve it
-            # We need to do this asynchronously, but play_next is sync (called by after callback).
-            # So we create a task to resolve and play.
-            if hasattr(next_track, 'get_source'): # It's a LazySource
-                asyncio.run_coroutine_threadsafe(self.resolve_and_play(next_track), self.bot.loop)
+    # --- Button Actions ---
+    async def toggle_pause(self, interaction):
+        try:
+            player = self.players.get(interaction.guild_id)
+            await interaction.response.defer()
+            if not player:
                 return
             
-            self.current_track = next_track
-            self._play_track(self.current_track)
-        else:
-            print("⏹️ Queue finished. Starting auto-disconnect timer (3m).")
-            self.current_track = None
-            asyncio.run_coroutine_threadsafe(self.update_dashboard(), self.bot.loop)
-            asyncio.run_coroutine_threadsafe(self.start_disconnect_timer(), self.bot.loop)
-
-    async def start_disconnect_timer(self):
-        await asyncio.sleep(180) # 3 minutes
-        if self.voice_client and not self.voice_client.is_playing() and not self.queue:
-            await self.voice_client.disconnect()
-            self.voice_client = None
-            print("👋 Disconnected due to inactivity.")
-            await self.send_notification("👋 Left the voice channel due to inactivity.", color=config.COLOR_ERROR)
-            await self.update_dashboard()
-
-    async def resolve_and_play(self, lazy_source):
-        try:
-            # Resolve LazySource to YTDLSource (returns a list, take first)
-            sources = await lazy_source.get_source(self.bot.loop)
-            if sources:
-                self.current_track = sources[0]
-                self._play_track(self.current_track)
-            else:
-                print("⚠️ Error: Resolved source is empty")
-                self.play_next()
+            player.control('toggle_pause')
         except Exception as e:
-            print(f"❌ Error resolving track: {e}")
+            print(f"❌ ERROR in toggle_pause: {e}")
             traceback.print_exc()
-            self.play_next()
 
-    def _play_track(self, track):
-        self.manual_skip = False
-        print(f"▶️ Now Playing: {track.title} ({track.formatted_duration}) | 👤 {track.requester.name}")
+    async def skip_track(self, interaction):
         try:
-            self.voice_client.play(track, after=self.after_play)
-            self.start_time = time.time()
-            print("🎵 Audio stream started")
+            player = self.players.get(interaction.guild_id)
+            if player:
+                player.control('skip')
+            await interaction.response.defer()
         except Exception as e:
-            print(f"❌ ERROR in voice_client.play: {e}")
+            print(f"❌ ERROR in skip_track: {e}")
             traceback.print_exc()
-            self.play_next() # Skip if error
-        
-        asyncio.run_coroutine_threadsafe(self.update_dashboard(), self.bot.loop)
-
-    def after_play(self, error):
-        if error:
-            print(f"❌ ERROR in after_play: {error}")
-        else:
-            elapsed = time.time() - self.start_time
-            if elapsed < 10 and not self.manual_skip:
-                print(f"⚠️ Track finished too quickly ({int(elapsed)}s). Possible playback error or region lock.")
-                asyncio.run_coroutine_threadsafe(
-                    self.send_notification(f"⚠️ **Error:** Track finished too quickly ({int(elapsed)}s). It might be region-locked.", color=config.COLOR_ERROR),
-                    self.bot.loop
-                )
-            else:
-                print("✅ Track finished")
-        
-        # Handle Loop
-        if self.loop_mode == 1 and self.current_track: # Loop Track
-            coro = self.requeue_current()
-            asyncio.run_coroutine_threadsafe(coro, self.bot.loop)
-            return
-        elif self.loop_mode == 2 and self.current_track: # Loop Queue
-            coro = self.requeue_current(front=False)
-            asyncio.run_coroutine_threadsafe(coro, self.bot.loop)
-            return
-
-        self.play_next()
 
-    async def requeue_current(self, front=True):
-        if not self.current_track:
-            self.play_next()
-            return
-            
+    async def stop_player(self, interaction):
         try:
-            # Re-create source from webpage_url (most reliable)
-            url = self.current_track.webpage_url or self.current_track.url
-            # We use create_source which returns a list
-            sources = await YTDLSource.create_source(url, loop=self.bot.loop, requester=self.current_track.requester, is_playlist_entry=True)
-            
-            if sources:
-                source = sources[0]
-                if front:
-                    self.queue.insert(0, source)
-                else:
-                    self.queue.append(source)
-            
-            self.play_next()
+            player = self.players.get(interaction.guild_id)
+            if player:
+                player.control('stop')
+            await interaction.response.defer()
         except Exception as e:
-            print(f"⚠️ Error requeueing: {e}")
-            self.play_next()
+            print(f"❌ ERROR in stop_player: {e}")
+            traceback.print_exc()
 
-    # --- Button Actions ---
-    async def toggle_pause(self, interaction):
+    async def shuffle_queue(self, interaction):
         try:
-            if not self.voice_client:
-                return await interaction.response.defer()
-            
-            if self.voice_client.is_paused():
-                self.voice_client.resume()
-                await interaction.response.defer()
-            elif self.voice_client.is_playing():
-                self.voice_client.pause()
-                await interaction.response.defer()
-            else:
-                await interaction.response.defer()
-            
-            await self.update_dashboard()
+            player = self.players.get(interaction.guild_id)
+            if player:
+                player.control('shuffle')
+            await interaction.response.defer()
         except Exception as e:
-            print(f"❌ ERROR in toggle_pause: {e}")
+            print(f"❌ ERROR in shuffle_queue: {e}")
             traceback.print_exc()
 
-    async def skip_track(self, interaction):
+    async def cycle_loop(self, interaction):
         try:
-            if not self.voice_client or not self.voice_client.is_playing():
-                return await interaction.response.defer()
-            self.manual_skip = True
-            self.voice_client.stop() # This triggers after_play -> play_next
+            player = self.players.get(interaction.guild_id)
+            if player:
+                player.control('cycle_loop')
             await interaction.response.defer()
         except Exception as e:
-            print(f"❌ ERROR in skip_track: {e}")
+            print(f"❌ ERROR in cycle_loop: {e}")
             traceback.print_exc()
 
-    async def stop_player(self, interaction):
+    async def seek(self, interaction, delta):
         try:
-            self.queue.clear()
-            if self.voice_client:
-                self.manual_skip = True
-                self.voice_client.stop()
-                # Do not disconnect, just stop playing
-            self.current_track = None
-            await self.update_dashboard()
+            player = self.players.get(interaction.guild_id)
+            if player:
+                player.control('seek', delta)
             await interaction.response.defer()
         except Exception as e:
-            print(f"❌ ERROR in stop_player: {e}")
+            print(f"❌ ERROR in seek: {e}")
             traceback.print_exc()
 
-    async def shuffle_queue(self, interaction):
+    async def cancel_ingest(self, interaction):
         try:
-            import random
-            if len(self.queue) < 1:
-                return await interaction.response.defer()
-            
-            random.shuffle(self.queue)
-            await self.update_dashboard()
+            player = self.players.get(interaction.guild_id)
+            if player and player.ingests:
+                player.cancel_ingests()
+                await player.update_dashboard()
             await interaction.response.defer()
         except Exception as e:
-            print(f"❌ ERROR in shuffle_queue: {e}")
+            print(f"❌ ERROR in cancel_ingest: {e}")
             traceback.print_exc()
 
 
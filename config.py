@@ -5,9 +5,111 @@ load_dotenv()
 # Discord Bot Token
 TOKEN = os.getenv("DISCORD_TOKEN")
 
-# Channel ID where the dashboard will live
-MUSIC_CHANNEL_ID = 1444789327711174676
+# Dashboard channel IDs, one per guild. Each channel's guild gets its own player.
+MUSIC_CHANNEL_IDS = [
+    1444789327711174676,
+]
 
 # Embed Colors
 COLOR_MAIN = 0x9B59B6  # Purple
 COLOR_ERROR = 0xE74C3C # Red
+
+# Number of upcoming queue entries resolved in the background while a track plays
+PREFETCH_COUNT = 1
+
+# yt-dlp resolution cache: max entries, TTL for URLs without an `expire` param,
+# and how many seconds before a stream URL expires the entry is refreshed
+RESOLVE_CACHE_SIZE = 512
+RESOLVE_CACHE_TTL = 1800
+RESOLVE_CACHE_EXPIRY_MARGIN = 300
+
+# Persistent metadata enrichment cache (iTunes/Deezer lookups), hits and misses
+METADATA_CACHE_PATH = "metadata_cache.db"
+METADATA_CACHE_HIT_TTL = 30 * 86400 # 30 days
+METADATA_CACHE_MISS_TTL = 86400 # 1 day
+CACHE_DB_TIMEOUT = 0.5 # Seconds a cache read/write waits for another process's lock before giving up
+CACHE_PURGE_INTERVAL = 3600 # Seconds between sweeps of expired rows from the SQLite store
+
+# Metadata provider endpoints (overridable for offline benchmarks)
+ITUNES_SEARCH_URL = "https://itunes.apple.com/search"
+DEEZER_SEARCH_URL = "https://api.deezer.com/search"
+METADATA_SEARCH_LIMIT = 10 # Candidates per provider search, ranked locally
+METADATA_MATCH_THRESHOLD = 0.6 # Minimum similarity score (0-1) to accept a candidate
+
+# Shared HTTP client (metadata providers): connection pool limits and timeouts in seconds
+HTTP_POOL_LIMIT = 100
+HTTP_POOL_LIMIT_PER_HOST = 10
+HTTP_TIMEOUT = 8
+HTTP_CONNECT_TIMEOUT = 3
+
+# yt-dlp extraction pool: "thread" or "process" workers, each with its own YoutubeDL
+EXTRACT_POOL_MODE = "thread"
+EXTRACT_WORKERS = 4
+EXTRACT_QUEUE_SIZE = 256
+EXTRACT_TIMEOUT = 30 # seconds per job
+
+# Minimum seconds between two edits of the same dashboard message
+DASHBOARD_MIN_INTERVAL = 2.0
+DASHBOARD_IDS_PATH = "dashboards.json" # Remembered dashboard message per channel, skips the history scan at startup
+
+# Playlist entries appended to the queue per page while a playlist streams in
+INGEST_PAGE_SIZE = 50
+
+# "opus": pass Opus streams straight through to Discord (codec copy, source loudness).
+# "pcm": always decode to PCM and scale volume in Python (higher CPU per stream).
+PLAYBACK_MODE = "opus"
+PLAYBACK_VOLUME = 0.5 # "pcm" mode only; in "opus" mode every track plays at source loudness
+
+# Optional on-disk Opus cache for tracks played at least AUDIO_CACHE_MIN_PLAYS times
+AUDIO_CACHE_ENABLED = False
+AUDIO_CACHE_DIR = "audio_cache"
+AUDIO_CACHE_MAX_BYTES = 2 * 1024 ** 3 # 2 GB, least recently played evicted first (split between cluster workers)
+AUDIO_CACHE_MIN_PLAYS = 3
+AUDIO_CACHE_TRACKED_PLAYS = 10000 # Play counts kept in memory, least recently played dropped first
+
+# Metrics: Prometheus text endpoint (set METRICS_PORT = None to disable) and/or a periodic file dump
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+METRICS_FILE = None # e.g. "metrics.prom"
+METRICS_DUMP_INTERVAL = 30
+
+# Seconds a playing track waits for metadata enrichment before keeping the yt-dlp title/artwork
+ENRICH_TIMEOUT = 5
+
+# Loop-track replay buffer: encoded frames of the current track kept for repeats
+LOOP_BUFFER_MEMORY_BYTES = 16 * 1024 ** 2
+LOOP_BUFFER_SPILL_BYTES = 64 * 1024 ** 2 # 0 disables the spill file
+
+# Spotify Web API (client credentials) used to read tracks, albums and playlists
+SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
+SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
+SPOTIFY_API_URL = "https://api.spotify.com/v1/"
+SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
+SPOTIFY_MATCH_CONCURRENCY = 8 # YouTube searches in flight per Spotify playlist
+SPOTIFY_MATCH_TTL = 90 * 86400
+
+# Queue journal: per-guild player state kept on disk and restored after a restart
+JOURNAL_ENABLED = True
+JOURNAL_DIR = "queue_journal"
+JOURNAL_COMPACT_EVERY = 1000 # Records before the log is rewritten as one snapshot
+JOURNAL_CHECKPOINT_INTERVAL = 15 # Seconds between playback position checkpoints
+
+# Per-player command processor: pending user controls (skip, stop, ...) and pending enqueues.
+# Enqueuers wait once the enqueue backlog is full; controls past their backlog are dropped.
+# Internal events (track finished, source resolved) are never dropped.
+PLAYER_CONTROL_BACKLOG = 64
+PLAYER_ENQUEUE_BACKLOG = 16
+
+# Cluster mode: more than 1 runs that many bot processes, each owning a range of gateway shards
+CLUSTER_WORKERS = 1
+SHARD_COUNT = None # None = ask Discord for the recommended count
+
+# Stream recovery: a track that ends short of its duration is re-resolved and resumed where it stopped
+STREAM_RESUME_ATTEMPTS = 2 # Per track, before it is treated as finished
+STREAM_END_TOLERANCE = 5 # Seconds short of the duration that still count as a normal end
+STREAM_RESUME_MIN_PLAYED = 5 # Seconds a stream must have played to be resumed; earlier failures are errors
+SEEK_STEP = 15 # Seconds moved by the seek buttons
+
+# Stream format: the smallest audio-only format of at least the voice channel's bitrate
+# (times this headroom) is streamed, Opus first in "opus" mode since it plays without transcoding
+STREAM_BITRATE_HEADROOM = 1.0
@@ -1,37 +1,131 @@
+import time
+PROCESS_START = time.perf_counter()
+
 import discord
 from discord.ext import commands
 import config
 import asyncio
 import os
+import signal
+from utils import http
+from utils.metadata_cache import metadata_cache, MetadataCache
+from utils.cache import resolution_cache
+from utils.audio import extraction_pool
+from utils.spotify import match_cache
+from utils.audio_cache import audio_cache
+from utils.metrics import start_exporter
+
+IMPORTS_DONE = time.perf_counter()
 
 # Setup Intent
 intents = discord.Intents.default()
 intents.message_content = True
 intents.voice_states = True
 
-class LyraBot(commands.Bot):
-    def __init__(self):
-        super().__init__(command_prefix="!", intents=intents, help_command=None)
+class LyraBot(commands.AutoShardedBot):
+    def __init__(self, shard_ids=None, shard_count=None):
+        # Without shard_ids the bot runs every shard Discord recommends; cluster workers pass their range
+        super().__init__(command_prefix="!", intents=intents, help_command=None, shard_ids=shard_ids, shard_count=shard_count)
+        self.startup_marks = {'imports': IMPORTS_DONE}
+
+    def mark_startup(self, stage):
+        """Log how long after process start `stage` was reached (once per stage)."""
+        if stage in self.startup_marks:
+            return
+        now = time.perf_counter()
+        previous = max(self.startup_marks.values())
+        self.startup_marks[stage] = now
+        print(f"⏱️ Startup: {stage} after {now - PROCESS_START:.2f}s (+{now - previous:.2f}s)")
+
+    async def setup_hook(self):
+        # Open the process-wide pooled HTTP session (see utils.http) on the bot's loop
+        http.get_session()
+        await start_exporter()
+        # yt-dlp loads in the background while the gateway connects
+        self.loop.create_task(self.warm_up())
+        self.loop.create_task(self.purge_caches())
+        self.mark_startup("setup hook")
+
+    async def warm_up(self):
+        try:
+            await extraction_pool.warm_up()
+            self.mark_startup("extractor warm-up")
+        except Exception as e:
+            print(f"⚠️ Extractor warm-up failed: {e}")
+
+    async def purge_caches(self):
+        """Drop expired rows from the SQLite store at startup and every CACHE_PURGE_INTERVAL."""
+        while not self.is_closed():
+            stores = [metadata_cache, match_cache, resolution_cache.shared]
+            for store in filter(None, stores):
+                try:
+                    removed = await self.loop.run_in_executor(None, store.purge_expired)
+                    if removed:
+                        print(f"🧹 Purged {removed} expired rows from {store.table}")
+                except Exception as e:
+                    print(f"⚠️ Could not purge {store.table}: {e}")
+            await asyncio.sleep(config.CACHE_PURGE_INTERVAL)
+
+    async def close(self):
+        await super().close()
+        await http.close_session()
+        metadata_cache.close()
+        match_cache.close()
+        if resolution_cache.shared:
+            resolution_cache.shared.close()
+        extraction_pool.shutdown()
 
     async def on_ready(self):
+        self.mark_startup("gateway ready")
         print(f'✅ Logged in as {self.user} (ID: {self.user.id})')
         print('➖ ------')
 
-async def main():
-    bot = LyraBot()
+async def main(shard_ids=None, shard_count=None):
+    bot = LyraBot(shard_ids=shard_ids, shard_count=shard_count)
+    if hasattr(signal, 'SIGTERM'):
+        # The cluster supervisor stops workers with SIGTERM; close cleanly so journals are frozen
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(bot.close()))
+        except NotImplementedError:
+            pass
+    print(f"⏱️ Startup: imports took {IMPORTS_DONE - PROCESS_START:.2f}s")
     
     # Load Cogs
     try:
         await bot.load_extension('cogs.music')
         print("📦 Loaded extension: cogs.music")
+        bot.mark_startup("extensions")
     except Exception as e:
         print(f"❌ Failed to load extension cogs.music: {e}")
 
     await bot.start(config.TOKEN)
 
-if __name__ == '__main__':
+def run_worker(cluster_id, shard_ids, shard_count):
+    """Entry point of one cluster process: a bot for `shard_ids` out of `shard_count`."""
+    # Each worker exports its own metrics
+    if config.METRICS_PORT:
+        config.METRICS_PORT += cluster_id
+    if config.METRICS_FILE:
+        config.METRICS_FILE = f"{config.METRICS_FILE}.{cluster_id}"
+    # Dashboards are per worker too, so workers never rewrite each other's file
+    config.DASHBOARD_IDS_PATH = f"{config.DASHBOARD_IDS_PATH}.{cluster_id}"
+    # Each worker caches audio in its own directory, with an equal share of the byte budget
+    audio_cache.directory = os.path.join(config.AUDIO_CACHE_DIR, f"cluster-{cluster_id}")
+    audio_cache.max_bytes = config.AUDIO_CACHE_MAX_BYTES // config.CLUSTER_WORKERS
+    # Resolutions go through the SQLite store too, so one worker's extraction serves the others
+    resolution_cache.shared = MetadataCache(config.METADATA_CACHE_PATH, table='resolutions')
     try:
-        asyncio.run(main())
+        asyncio.run(main(shard_ids=shard_ids, shard_count=shard_count))
     except KeyboardInterrupt:
-        # Handle graceful shutdown
         pass
+
+if __name__ == '__main__':
+    if config.CLUSTER_WORKERS > 1:
+        from utils.cluster import Supervisor
+        Supervisor(run_worker, config.CLUSTER_WORKERS, shard_count=config.SHARD_COUNT).run()
+    else:
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            # Handle graceful shutdown
+            pass
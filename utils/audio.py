@@ -1,104 +1,261 @@
 import asyncio
-import functools
-import yt_dlp
+import time
 import discord
 import re
-import aiohttp
 import urllib.parse
+from utils.cache import resolution_cache, canonical_video_id, normalize_link, SingleFlight
+from utils.audio_cache import audio_cache
+from utils.metadata_cache import metadata_cache, make_key, NOISE_RE, ARTIST_NOISE_RE
+from utils.http import get_session
+from utils.extractor import ExtractionPool, PRIORITY_PLAY, PRIORITY_BACKGROUND, load_yt_dlp
+import config
+from utils.metrics import metrics
+from utils.replay import ReplayBuffer
+from utils.formats import audio_formats, select_stream
 
-# Suppress noise from youtube_dl and bug reports
-yt_dlp.utils.bug_reports_message = lambda *args, **kwargs: ''
+FRAME_SECONDS = discord.opus.Encoder.FRAME_LENGTH / 1000 # Audio per read() call
 
 async def fetch_better_metadata(title, artist=None):
+    key = make_key(title, artist)
     try:
-        search_queries = []
-        # Clean title
-        clean_title = re.sub(r'[\\(\\[](official|video|lyrics|audio|mv|hq).*?[\\)\\]]', '', title, flags=re.IGNORECASE).strip()
-        search_queries.append(clean_title)
-        
-        if artist:
-            # Clean artist (remove "Topic", "Official", etc)
-            clean_artist = re.sub(r'(Topic|Official|VEVO|Channel)', '', artist, flags=re.IGNORECASE).strip()
-            if clean_artist and clean_artist.lower() not in clean_title.lower():
-                search_queries.append(f"{clean_artist} {clean_title}")
-
-        async with aiohttp.ClientSession() as session:
-            for query in reversed(search_queries): # Try most specific first (Artist + Title)
-                encoded_query = urllib.parse.quote(query)
-                async with session.get(f"https://itunes.apple.com/search?term={encoded_query}&media=music&limit=1") as response:
-                    if response.status == 200:
-                        # iTunes returns text/javascript sometimes, so we disable content_type check
-                        data = await response.json(content_type=None)
-                        if data['results']:
-                            item = data['results'][0]
-                            # Verify similarity
-                            found_title = item.get('trackName', '').lower()
-                            found_artist = item.get('artistName', '').lower()
-                            
-                            # Basic check: Title must be somewhat similar
-                            # We check if the search query words are in the found title
-                            # or if the found title is in the search query
-                            clean_query = query.lower()
-                            
-                            # If we have an artist, check if it matches too
-                            if artist:
-                                clean_artist_input = artist.lower()
-                                if clean_artist_input not in found_artist and found_artist not in clean_artist_input:
-                                    continue # Artist mismatch, try next or fallback
-
-                            # Title check (loose)
-                            # If the found title is completely different, skip
-                            # Simple heuristic: Check if at least one significant word matches
-                            # or if it's a substring
-                            if clean_title.lower() not in found_title and found_title not in clean_title.lower():
-                                # One last check: Levenshtein distance or similar would be better, 
-                                # but for now let's just be conservative.
-                                # If the query was "Just disappear" and result is "Sayonara Elegy", this catches it.
-                                continue
-
-                            return {
-                                'artwork': item.get('artworkUrl100', '').replace('100x100', '600x600'),
-                                'title': item.get('trackName'),
-                                'artist': item.get('artistName')
-                            }
-            
-            # Fallback to Deezer
-            for query in reversed(search_queries):
-                encoded_query = urllib.parse.quote(query)
-                async with session.get(f"https://api.deezer.com/search?q={encoded_query}&limit=1") as response:
-                    if response.status == 200:
-                        data = await response.json(content_type=None)
-                        if data.get('data'):
-                            item = data['data'][0]
-                            
-                            # Verify similarity (Deezer)
-                            found_title = item.get('title', '').lower()
-                            found_artist = item.get('artist', {}).get('name', '').lower()
-                            clean_query = query.lower()
-
-                            if artist:
-                                clean_artist_input = artist.lower()
-                                if clean_artist_input not in found_artist and found_artist not in clean_artist_input:
-                                    continue
-
-                            if clean_title.lower() not in found_title and found_title not in clean_title.lower():
-                                continue
-
-                            album = item.get('album', {})
-                            art = album.get('cover_xl') or album.get('cover_big') or album.get('cover_medium')
-                            return {
-                                'artwork': art,
-                                'title': item.get('title'),
-                                'artist': item.get('artist', {}).get('name')
-                            }
-
+        found, metadata = metadata_cache.get(key)
+        if found:
+            return metadata
+        return await metadata_flight.run(key, lambda: _fetch_and_cache(key, title, artist))
     except Exception as e:
         print(f"⚠️ Metadata fetch error: {e}")
     return None
 
-class YTDLSource(discord.PCMVolumeTransformer):
+async def _fetch_and_cache(key, title, artist):
+    metadata, conclusive = await _lookup_metadata(title, artist)
+    # Only remember a "no match" when every provider actually answered
+    if metadata or conclusive:
+        metadata_cache.put(key, metadata)
+    return metadata
+
+async def _lookup_metadata(title, artist=None):
+    """Query iTunes and Deezer concurrently. Returns (metadata or None, whether all requests succeeded).
+
+    Each provider gets a single search returning up to METADATA_SEARCH_LIMIT
+    candidates, ranked locally by `_score`. Providers are accepted in a fixed
+    priority order (iTunes before Deezer), so Deezer only wins once iTunes has
+    answered without a match above METADATA_MATCH_THRESHOLD.
+    """
+    clean_title = NOISE_RE.sub('', title).strip()
+    query = clean_title
+    clean_artist = ''
+    if artist:
+        # Clean artist (remove "Topic", "Official", etc)
+        clean_artist = ARTIST_NOISE_RE.sub('', artist).strip()
+        if clean_artist and clean_artist.lower() not in clean_title.lower():
+            query = f"{clean_artist} {clean_title}"
+    wanted = (_tokens(clean_title), _tokens(clean_artist))
+
+    session = get_session()
+    tasks = [asyncio.ensure_future(provider(session, query, wanted)) for provider in (_query_itunes, _query_deezer)]
+
+    try:
+        pending = set(tasks)
+        while True:
+            # Walk in priority order; stop at the first task still running
+            for task in tasks:
+                if not task.done():
+                    break
+                if task.exception() is None and task.result()[0]:
+                    return task.result()[0], True
+            else:
+                conclusive = all(t.exception() is None and t.result()[1] for t in tasks)
+                return None, conclusive
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+TOKEN_RE = re.compile(r'\w+')
+FEAT_RE = re.compile(r'[\(\[]?\b(feat|ft|featuring)\b\.?.*?([\)\]]|$)', re.IGNORECASE)
+TITLE_WEIGHT = 0.55
+
+def _tokens(text):
+    return frozenset(TOKEN_RE.findall(FEAT_RE.sub(' ', NOISE_RE.sub(' ', text or '')).lower()))
+
+def _similarity(found, wanted):
+    """Share of the candidate's tokens present in what we searched for, nudged by Dice overlap."""
+    if not found or not wanted:
+        return 0.0
+    common = len(found & wanted)
+    return 0.75 * common / len(found) + 0.25 * 2 * common / (len(found) + len(wanted))
+
+def _score(found_title, found_artist, wanted):
+    """Score a search candidate in [0, 1] against the (title tokens, artist tokens) we have.
+
+    YouTube titles often carry the artist ("Artist - Song"), so the candidate
+    artist is checked against the title tokens too. With no artist to compare
+    against at all, only the title counts.
+    """
+    title_tokens, artist_tokens = wanted
+    title_score = _similarity(_tokens(found_title), title_tokens)
+    found_artist = _tokens(found_artist)
+    if not artist_tokens and not (found_artist & title_tokens):
+        return title_score
+    artist_score = _similarity(found_artist, artist_tokens | title_tokens)
+    return TITLE_WEIGHT * title_score + (1 - TITLE_WEIGHT) * artist_score
+
+def _best_candidate(candidates, wanted):
+    """Return the (title, artist, item) candidate scoring highest above the threshold, or None."""
+    best, best_score = None, config.METADATA_MATCH_THRESHOLD
+    for found_title, found_artist, item in candidates:
+        score = _score(found_title, found_artist, wanted)
+        if score >= best_score and (best is None or score > best_score):
+            best, best_score = item, score
+    return best
+
+async def _query_itunes(session, query, wanted):
+    """Returns (metadata or None, whether the request succeeded)."""
+    encoded_query = urllib.parse.quote(query)
+    with metrics.timer("lyra_metadata_seconds", provider="itunes"):
+        async with session.get(f"{config.ITUNES_SEARCH_URL}?term={encoded_query}&media=music&entity=song&limit={config.METADATA_SEARCH_LIMIT}") as response:
+            if response.status != 200:
+                if response.status == 429:
+                    metrics.inc("lyra_http_429_total", service="itunes")
+                return None, False
+            # iTunes returns text/javascript sometimes, so we disable content_type check
+            data = await response.json(content_type=None)
+
+    item = _best_candidate(
+        ((item.get('trackName', ''), item.get('artistName', ''), item) for item in data.get('results') or []),
+        wanted,
+    )
+    if item is None:
+        return None, True
+
+    return {
+        'artwork': item.get('artworkUrl100', '').replace('100x100', '600x600'),
+        'title': item.get('trackName'),
+        'artist': item.get('artistName')
+    }, True
+
+async def _query_deezer(session, query, wanted):
+    """Returns (metadata or None, whether the request succeeded)."""
+    encoded_query = urllib.parse.quote(query)
+    with metrics.timer("lyra_metadata_seconds", provider="deezer"):
+        async with session.get(f"{config.DEEZER_SEARCH_URL}?q={encoded_query}&limit={config.METADATA_SEARCH_LIMIT}") as response:
+            if response.status != 200:
+                if response.status == 429:
+                    metrics.inc("lyra_http_429_total", service="deezer")
+                return None, False
+            data = await response.json(content_type=None)
+
+    item = _best_candidate(
+        ((item.get('title', ''), item.get('artist', {}).get('name', ''), item) for item in data.get('data') or []),
+        wanted,
+    )
+    if item is None:
+        return None, True
+
+    album = item.get('album', {})
+    art = album.get('cover_xl') or album.get('cover_big') or album.get('cover_medium')
+    return {
+        'artwork': art,
+        'title': item.get('title'),
+        'artist': item.get('artist', {}).get('name')
+    }, True
+
+class TrackRecord:
+    """The handful of track fields the player and dashboard read.
+
+    The raw yt-dlp info dict (formats, thumbnails, headers...) is not kept;
+    `fetch_data` re-resolves it when something actually needs it.
+    """
+    __slots__ = ('title', 'url', 'webpage_url', 'duration', 'uploader', 'thumbnail', 'requester_id', 'enriched')
+
+    def _set_fields(self, data, requester_id):
+        self.title = data.get('title')
+        self.url = data.get('url')
+        self.webpage_url = data.get('webpage_url')
+        self.duration = data.get('duration')
+        self.uploader = data.get('uploader') or data.get('artist')
+        self.thumbnail = data.get('thumbnail')
+        self.requester_id = requester_id
+        self.enriched = data.get('enriched', False)
+
+    def to_dict(self):
+        return {
+            'title': self.title,
+            'url': self.url,
+            'webpage_url': self.webpage_url,
+            'duration': self.duration,
+            'uploader': self.uploader,
+            'thumbnail': self.thumbnail,
+            'enriched': self.enriched,
+        }
+
+    @property
+    def formatted_duration(self):
+        if not self.duration:
+            return "Unknown"
+        seconds = int(self.duration)
+        minutes, seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        if hours > 0:
+            return f"{hours}:{minutes:02d}:{seconds:02d}"
+        return f"{minutes}:{seconds:02d}"
+
+    @property
+    def requester_mention(self):
+        return f"<@{self.requester_id}>" if self.requester_id else "Unknown"
+
+    async def fetch_data(self, priority=PRIORITY_BACKGROUND):
+        """Re-fetch the full info dict for this track."""
+        return await YTDLSource.resolve_data(self.webpage_url or self.url, priority=priority)
+
+async def enrich_track(track, timeout=None):
+    """Look up better title/artist/artwork for a track and apply it in place.
+
+    Meant to run in the background once audio has started. The lookup keeps
+    going past `timeout` so its result still lands in the metadata cache, but
+    the track is only updated if it arrives in time. Returns True if anything
+    changed.
+    """
+    if track.enriched or not track.title:
+        return False
+    track.enriched = True
+
+    lookup = asyncio.ensure_future(fetch_better_metadata(track.title, track.uploader))
+    try:
+        metadata = await asyncio.wait_for(asyncio.shield(lookup), timeout or config.ENRICH_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"⚠️ Metadata enrichment missed its deadline for: {track.title}")
+        return False
+    if not metadata:
+        return False
+
+    changes = {}
+    if metadata.get('artwork'):
+        changes['thumbnail'] = metadata['artwork']
+    if metadata.get('title'):
+        changes['title'] = metadata['title']
+    if metadata.get('artist'):
+        changes['uploader'] = metadata['artist']
+    for field, value in changes.items():
+        setattr(track, field, value)
+
+    # Later resolutions of the same video start out enriched
+    resolution_cache.update(canonical_video_id(track.webpage_url or track.url), dict(changes, enriched=True))
+    return bool(changes)
+
+class YTDLSource(discord.AudioSource, TrackRecord):
+    """A playable track.
+
+    In "opus" playback mode an Opus stream is handed to Discord with the codec
+    copied (no decode, no per-frame volume scaling, no re-encode) and plays at
+    its source loudness. Other codecs are decoded with FFmpegPCMAudio and play at
+    the same source loudness, so a queue doesn't jump in volume between codecs.
+    In "pcm" mode every track is decoded and scaled to PLAYBACK_VOLUME.
+    """
     YTDL_OPTIONS = {
-        'format': 'bestaudio/best',
+        # Prefer an Opus-native stream so it can be passed through untouched
+        'format': 'bestaudio[acodec=opus]/bestaudio/best' if config.PLAYBACK_MODE == 'opus' else 'bestaudio/best',
         'extractaudio': True,
         'audioformat': 'mp3',
         'outtmpl': '%(extractor)s-%(id)s-%(title)s.%(ext)s',
@@ -119,131 +276,347 @@ class YTDLSource(discord.PCMVolumeTransformer):
         'options': '-vn',
     }
 
-    ytdl = yt_dlp.YoutubeDL(YTDL_OPTIONS)
+    FFMPEG_LOCAL_OPTIONS = {
+        'options': '-vn',
+    }
 
-    def __init__(self, source, *, data, volume=0.5, requester=None):
-        super().__init__(source, volume)
-        self.requester = requester
-        self.data = data
-        self.title = data.get('title')
-        self.url = data.get('url')
-        self.webpage_url = data.get('webpage_url')
-        self.duration = data.get('duration')
-        self.uploader = data.get('uploader')
-        self.thumbnail = data.get('thumbnail')
+    _ytdl = None
+
+    @classmethod
+    def get_ytdl(cls):
+        """Shared YoutubeDL for local helpers (filenames); built on first use, not at import."""
+        if cls._ytdl is None:
+            cls._ytdl = load_yt_dlp().YoutubeDL(cls.YTDL_OPTIONS)
+        return cls._ytdl
+
+    def __init__(self, source, *, data, volume=None, requester_id=None):
+        if volume is None:
+            volume = config.PLAYBACK_VOLUME if config.PLAYBACK_MODE == 'pcm' else 1.0
+        if not source.is_opus() and volume != 1.0:
+            source = discord.PCMVolumeTransformer(source, volume)
+        self.source = source
+        self.passthrough = source.is_opus()
+        self.play_requested_at = None # Set by the player right before voice_client.play
+        self.replay_buffer = None
+        self._recording = False
+        self.start_offset = 0 # Seconds into the track this play starts at
+        self.frames = 0 # Frames handed to the voice client so far; pauses don't read any
+        self.stream_format = None # {'format_id', 'acodec', 'abr'} picked for the voice channel, if any
+        self._set_fields(data, requester_id)
+
+    def read(self):
+        data = self.source.read()
+        if data:
+            self.frames += 1
+        if self.play_requested_at is not None:
+            metrics.observe("lyra_first_frame_seconds", time.perf_counter() - self.play_requested_at)
+            self.play_requested_at = None
+        if self._recording:
+            if data:
+                self.replay_buffer.append(data)
+            else:
+                self.replay_buffer.finish()
+                self._recording = False
+        return data
 
     @property
-    def formatted_duration(self):
-        if not self.duration:
-            return "Unknown"
-        seconds = int(self.duration)
-        minutes, seconds = divmod(seconds, 60)
-        hours, minutes = divmod(minutes, 60)
-        if hours > 0:
-            return f"{hours}:{minutes:02d}:{seconds:02d}"
-        return f"{minutes}:{seconds:02d}"
+    def position(self):
+        """Seconds into the track, counted in frames actually played."""
+        return self.start_offset + self.frames * FRAME_SECONDS
+
+    def start_recording(self):
+        """Keep every frame of this play in a ReplayBuffer so loop-track can repeat it for free."""
+        if self.replay_buffer is None:
+            self.replay_buffer = ReplayBuffer(
+                self.is_opus(),
+                memory_budget=config.LOOP_BUFFER_MEMORY_BYTES,
+                spill_budget=config.LOOP_BUFFER_SPILL_BYTES,
+            )
+            self._recording = True
+
+    @property
+    def can_replay(self):
+        buffer = self.replay_buffer
+        if buffer is None or not buffer.complete:
+            return False
+        # A stream that died early also ends in EOF; only trust a recording that covers the track
+        return not self.duration or buffer.seconds >= float(self.duration) - 2
+
+    def replay(self):
+        """A new source playing this track's recorded frames, without FFmpeg or network."""
+        # Recorded PCM already went through the volume transformer once
+        source = YTDLSource(self.replay_buffer.reader(), data=self.to_dict(), volume=1.0, requester_id=self.requester_id)
+        source.replay_buffer = self.replay_buffer
+        source.stream_format = self.stream_format
+        return source
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.source.cleanup()
+
+    @classmethod
+    def open_audio(cls, path, data, start_at=0):
+        """Spawn the FFmpeg reader for `path`, copying the codec when the stream is already Opus."""
+        options = cls.FFMPEG_LOCAL_OPTIONS if data.get('is_local') else cls.FFMPEG_OPTIONS
+        if start_at:
+            options = dict(options)
+            options['before_options'] = f"-ss {start_at:.2f} {options.get('before_options', '')}".strip()
+        with metrics.timer("lyra_ffmpeg_spawn_seconds"):
+            if config.PLAYBACK_MODE == 'opus' and data.get('acodec') == 'opus':
+                return discord.FFmpegOpusAudio(path, codec='copy', **options)
+            return discord.FFmpegPCMAudio(path, **options)
 
     @classmethod
-    async def from_url(cls, url, *, loop=None, stream=True, requester=None):
+    async def from_url(cls, url, *, loop=None, stream=True, requester_id=None):
         loop = loop or asyncio.get_event_loop()
-        data = await loop.run_in_executor(None, lambda: cls.ytdl.extract_info(url, download=not stream))
+        data = await extraction_pool.extract(url, download=not stream)
 
         if 'entries' in data:
             # take first item from a playlist
             data = data['entries'][0]
 
-        filename = data['url'] if stream else cls.ytdl.prepare_filename(data)
-        return cls(discord.FFmpegPCMAudio(filename, **cls.FFMPEG_OPTIONS), data=data, requester=requester)
+        filename = data['url'] if stream else cls.get_ytdl().prepare_filename(data)
+        return cls(cls.open_audio(filename, data), data=data, requester_id=requester_id)
 
     @classmethod
-    async def create_source(cls, search: str, *, loop=None, requester=None, is_playlist_entry=False):
+    async def create_source(cls, search: str, *, loop=None, requester_id=None, on_ingest=None, bitrate=None):
+        """Resolve a link into playable sources: the first entry fully, the rest as LazySource.
+
+        Playlists are read page by page. Only the first entry is fetched up front;
+        if `on_ingest` is given it receives a PlaylistIngest that streams the rest
+        in the background, otherwise the remaining pages are read before returning.
+
+        Concurrent requests for the same link share one resolution (and one page
+        reader); each caller still gets its own sources with its own requester.
+        `bitrate` is the target voice channel's, in bits/s (see `select_stream`).
+        """
         loop = loop or asyncio.get_event_loop()
-        
-        partial = functools.partial(cls.ytdl.extract_info, search, download=False, process=False)
-        data = await loop.run_in_executor(None, partial)
+
+        # Single-video links don't need the flat pass; go straight to the (cached) full resolution
+        if canonical_video_id(search):
+            processed_data = await cls.resolve_data(search, loop=loop, search=search)
+            return [cls.from_data(processed_data, requester_id=requester_id, bitrate=bitrate)]
+
+        processed_data, title, pages = await link_flight.run(normalize_link(search), lambda: cls._open_link(search, loop))
+        sources = [cls.from_data(processed_data, requester_id=requester_id, bitrate=bitrate)]
+
+        if pages:
+            ingest = PlaylistIngest(pages, requester_id, title=title)
+            if on_ingest:
+                on_ingest(ingest)
+            else:
+                # No one to stream to: read the whole playlist now
+                async def collect(page):
+                    sources.extend(page)
+                await ingest.run(collect)
+        return sources
+
+    @classmethod
+    async def _open_link(cls, search, loop):
+        """Flat-extract a link and fully resolve its first entry. Returns (data, title, SharedPages or None)."""
+        with metrics.timer("lyra_extract_flat_seconds"):
+            data = await extraction_pool.extract(search, process=False, page_size=1)
 
         if data is None:
             raise Exception("Could not find anything matching `{}`".format(search))
 
-        sources = []
-        entries = []
-
+        pager = data.pop('_pager', None)
         if 'entries' in data:
-            entries = list(data['entries'])
+            entries = data['entries']
         else:
             entries = [data]
 
-        # If it's a single entry request (is_playlist_entry=True), we just want one result
-        if is_playlist_entry and entries:
-            entries = [entries[0]]
+        if not entries:
+            raise Exception("Could not find anything matching `{}`".format(search))
 
-        # Process the first entry fully (so we can play it immediately)
-        # Process others as LazySource
-        
-        for i, entry in enumerate(entries):
-            if i == 0:
-                # Fully resolve the first one
-                webpage_url = entry.get('webpage_url') or entry.get('url')
-                partial = functools.partial(cls.ytdl.extract_info, webpage_url, download=False)
-                processed_data = await loop.run_in_executor(None, partial)
-                
-                if 'entries' in processed_data:
-                    processed_data = processed_data['entries'][0]
-
-                # Try to get better artwork and metadata
-                artist = processed_data.get('artist') or processed_data.get('uploader')
-                metadata = await fetch_better_metadata(processed_data.get('title', search), artist)
-                if metadata:
-                    if metadata.get('artwork'):
-                        processed_data['thumbnail'] = metadata['artwork']
-                    if metadata.get('title'):
-                        processed_data['title'] = metadata['title']
-                    if metadata.get('artist'):
-                        processed_data['uploader'] = metadata['artist']
-                
-                sources.append(cls(discord.FFmpegPCMAudio(processed_data['url'], **cls.FFMPEG_OPTIONS), data=processed_data, requester=requester))
-            else:
-                # Lazy load the rest
-                sources.append(LazySource(entry, requester))
+        # Fully resolve the first one so we can play it immediately
+        entry = entries[0]
+        webpage_url = entry.get('webpage_url') or entry.get('url')
+        try:
+            processed_data = await cls.resolve_data(webpage_url, loop=loop, search=search)
+        except BaseException:
+            if pager:
+                extraction_pool.close_pager(pager)
+            raise
+        return processed_data, data.get('title'), SharedPages(pager) if pager else None
+
+    @classmethod
+    async def resolve_data(cls, url, *, loop=None, search=None, priority=PRIORITY_PLAY):
+        """Run the full extraction for a single track, without starting FFmpeg.
+
+        Metadata enrichment is not awaited here; see `enrich_track`.
+        """
+        loop = loop or asyncio.get_event_loop()
+        video_id = canonical_video_id(url)
+        local = audio_cache.lookup(video_id)
+        if local:
+            return local
+        cached = resolution_cache.get(video_id) or await resolution_cache.get_shared(video_id)
+        if cached:
+            return cached
+        # Callers resolving the same video at the same time share one extraction
+        return await resolve_flight.run(video_id or url, lambda: cls._extract_data(url, video_id, priority))
+
+    @classmethod
+    async def _extract_data(cls, url, video_id, priority):
+        with metrics.timer("lyra_extract_full_seconds"):
+            processed_data = await extraction_pool.extract(url, priority=priority)
         
-        return sources
+        if 'entries' in processed_data:
+            processed_data = processed_data['entries'][0]
 
-class LazySource:
-    def __init__(self, data, requester):
-        self.data = data
-        self.requester = requester
-        self.title = data.get('title')
-        self.url = data.get('url')
-        self.webpage_url = data.get('webpage_url')
-        self.duration = data.get('duration')
-        self.uploader = data.get('uploader') or data.get('artist')
-        self.thumbnail = data.get('thumbnail')
+        if processed_data.get('extractor_key') == 'Youtube':
+            video_id = video_id or processed_data.get('id')
+        # Keep the audio-only formats so each play can pick one for its channel's bitrate
+        processed_data['audio_formats'] = audio_formats(processed_data)
+        processed_data['baseline_abr'] = processed_data.get('abr')
+        resolution_cache.put(video_id, processed_data)
+        return processed_data
+
+    @classmethod
+    def from_data(cls, data, *, requester_id=None, start_at=0, bitrate=None):
+        data, choice = select_stream(data, bitrate, start_at)
+        source = cls(cls.open_audio(data['url'], data, start_at), data=data, requester_id=requester_id)
+        source.start_offset = start_at
+        source.stream_format = choice
+        return source
+
+# Every extraction runs here instead of on the default executor with the shared class-level instance
+extraction_pool = ExtractionPool(
+    YTDLSource.YTDL_OPTIONS,
+    workers=config.EXTRACT_WORKERS,
+    mode=config.EXTRACT_POOL_MODE,
+    queue_size=config.EXTRACT_QUEUE_SIZE,
+    timeout=config.EXTRACT_TIMEOUT,
+)
+metrics.add_collector("lyra_extract_pool", "Extraction pool counters", extraction_pool.stats)
+
+# In-flight coalescing: per video for resolutions, per normalized link for playlists/searches
+resolve_flight = SingleFlight()
+link_flight = SingleFlight()
+metadata_flight = SingleFlight()
+metrics.add_collector("lyra_resolve_flight", "Coalesced video resolutions", resolve_flight.stats)
+metrics.add_collector("lyra_link_flight", "Coalesced link requests", link_flight.stats)
+metrics.add_collector("lyra_metadata_flight", "Coalesced metadata lookups", metadata_flight.stats)
+
+class LazySource(TrackRecord):
+    __slots__ = ('_resolve_task',)
+
+    def __init__(self, data, requester_id):
+        self._set_fields(data, requester_id)
+        self._resolve_task = None
+
+    def prefetch(self, loop, priority=PRIORITY_BACKGROUND):
+        """Start resolving this entry in the background. Returns the (shared) resolution task."""
+        task = self._resolve_task
+        if task is None or task.cancelled() or (task.done() and task.exception() is not None):
+            url = self.webpage_url or self.url
+            self._resolve_task = loop.create_task(YTDLSource.resolve_data(url, loop=loop, priority=priority))
+        return self._resolve_task
+
+    def cancel_prefetch(self):
+        if self._resolve_task and not self._resolve_task.done():
+            self._resolve_task.cancel()
+        self._resolve_task = None
+
+    async def get_source(self, loop, start_at=0, bitrate=None):
+        # Resolve this lazy source into a real YTDLSource, reusing a prefetch if one is running or done
+        data = await self.prefetch(loop, priority=PRIORITY_PLAY)
+        return [YTDLSource.from_data(data, requester_id=self.requester_id, start_at=start_at, bitrate=bitrate)]
+
+
+class SharedPages:
+    """A playlist's remaining pages, read once from its Pager and shared by every ingest of the same link.
+
+    A page is kept only until every reader has moved past it, so a reader
+    that is behind gets it without another extraction while a lone reader
+    holds nothing. Readers acquire before the first `get`. The pager is
+    closed early once every reader has let go.
+    """
+
+    def __init__(self, pager):
+        self.pager = pager
+        self.pages = [] # Pages from index `base` on that some reader still needs
+        self.base = 0
+        self.finished = False
+        self.positions = {} # reader -> index of the next page it will ask for
+        self._lock = asyncio.Lock()
 
     @property
-    def formatted_duration(self):
-        if not self.duration:
-            return "Unknown"
-        seconds = int(self.duration)
-        minutes, seconds = divmod(seconds, 60)
-        hours, minutes = divmod(minutes, 60)
-        if hours > 0:
-            return f"{hours}:{minutes:02d}:{seconds:02d}"
-        return f"{minutes}:{seconds:02d}"
+    def readers(self):
+        return len(self.positions)
 
-    async def get_source(self, loop):
-        # Resolve this lazy source into a real YTDLSource
-        url = self.webpage_url or self.url
-        return await YTDLSource.create_source(url, loop=loop, requester=self.requester, is_playlist_entry=True)
+    def acquire(self, reader):
+        self.positions[reader] = self.base
 
-    @classmethod
-    async def create_source(cls, search: str, *, loop=None, requester=None, is_playlist_entry=False):
-        # This is a wrapper to keep the name consistent if needed, 
-        # but actually we are modifying YTDLSource.create_source below.
-        pass
+    def release(self, reader):
+        self.positions.pop(reader, None)
+        if not self.positions:
+            self.pages = []
+            self.close()
+        else:
+            self._trim()
+
+    def _trim(self):
+        passed = min(self.positions.values()) - self.base
+        if passed > 0:
+            del self.pages[:passed]
+            self.base += passed
+
+    def close(self):
+        if not self.finished:
+            self.finished = True
+            extraction_pool.close_pager(self.pager)
+
+    async def get(self, reader, index, page_size):
+        """Entries of page `index` for `reader`, or [] past the end. Earlier pages are done with."""
+        async with self._lock:
+            self.positions[reader] = index + 1
+            while self.base + len(self.pages) <= index and not self.finished:
+                entries = await extraction_pool.next_page(self.pager, page_size)
+                self.pages.append(entries)
+                if len(entries) < page_size:
+                    # The worker drops an exhausted iterator by itself
+                    self.finished = True
+            entries = self.pages[index - self.base] if 0 <= index - self.base < len(self.pages) else []
+            self._trim()
+        return entries
+
+
+class PlaylistIngest:
+    """Streams the remaining entries of a playlist into the queue, one page at a time."""
+
+    def __init__(self, pages, requester_id, title=None, page_size=None):
+        self.pages = pages
+        self.pages.acquire(self)
+        self.requester_id = requester_id
+        self.title = title or "playlist"
+        self.page_size = page_size or config.INGEST_PAGE_SIZE
+        self.added = 0
+        self.cancelled = False
+        self.done = False
 
-# Monkey-patching or modifying YTDLSource.create_source directly in the file
-# We will replace the existing create_source method in YTDLSource with the new logic.
+    def cancel(self):
+        self.cancelled = True
 
+    async def run(self, on_page):
+        """Read pages until the playlist ends or the ingest is cancelled; `on_page` gets LazySource lists."""
+        try:
+            index = 0
+            while not self.cancelled:
+                entries = await self.pages.get(self, index, self.page_size)
+                index += 1
+                if self.cancelled:
+                    break
+                if entries:
+                    page = [LazySource(entry, self.requester_id) for entry in entries if entry]
+                    self.added += len(page)
+                    await on_page(page)
+                if len(entries) < self.page_size:
+                    break
+        finally:
+            self.pages.release(self)
+            self.done = True
 
-def resolve_spotify_url(url: str) -> str:
-    return url
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict
+import config
+from utils.metrics import metrics
+
+# Track fields kept next to each cached file, so a cached play needs no extraction at all
+SIDECAR_FIELDS = ('title', 'webpage_url', 'duration', 'uploader', 'thumbnail')
+
+
+class AudioCache:
+    """Size-bounded on-disk cache of Opus audio for frequently played tracks.
+
+    A track is stored once it has been played `min_plays` times. Files are kept
+    in an Ogg/Opus container under `directory` and evicted least-recently-used
+    first whenever the total exceeds `max_bytes`.
+    """
+
+    def __init__(self, directory, max_bytes, min_plays=3, enabled=True, max_tracked=10000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self.enabled = enabled
+        self._files = OrderedDict() # video_id -> size in bytes, oldest use first
+        self._plays = OrderedDict() # video_id -> play count, at most `max_tracked`, least recent first
+        self.max_tracked = max_tracked
+        self._storing = set()
+        self._loaded = False
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def _audio_path(self, video_id):
+        return os.path.join(self.directory, f"{video_id}.opus")
+
+    def _sidecar_path(self, video_id):
+        return os.path.join(self.directory, f"{video_id}.json")
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.opus'):
+                continue
+            path = os.path.join(self.directory, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, name[:-len('.opus')], stat.st_size))
+        for _, video_id, size in sorted(entries):
+            self._files[video_id] = size
+            self.total_bytes += size
+        self._evict()
+
+    def lookup(self, video_id):
+        """Return an info dict pointing at the local file, or None."""
+        if not self.enabled or not video_id:
+            return None
+        self._load()
+        if video_id not in self._files:
+            self.misses += 1
+            return None
+        try:
+            with open(self._sidecar_path(video_id)) as f:
+                data = json.load(f)
+            os.utime(self._audio_path(video_id))
+        except (OSError, ValueError):
+            self._remove(video_id)
+            self.misses += 1
+            return None
+
+        self._files.move_to_end(video_id)
+        self.hits += 1
+        data['url'] = self._audio_path(video_id)
+        data['acodec'] = 'opus'
+        data['is_local'] = True
+        return data
+
+    def record_play(self, video_id, track, loop):
+        """Count a play; schedule a store once the track passes the play-count threshold."""
+        if not self.enabled or not video_id or not track.url:
+            return
+        self._load()
+        if video_id in self._files or video_id in self._storing or os.path.exists(track.url):
+            return
+        plays = self._plays.pop(video_id, 0) + 1
+        self._plays[video_id] = plays
+        while len(self._plays) > self.max_tracked:
+            # Forget the tracks that haven't been played for the longest
+            self._plays.popitem(last=False)
+        if plays >= self.min_plays:
+            self._storing.add(video_id)
+            loop.create_task(self._store(video_id, track))
+
+    async def _store(self, video_id, track):
+        path = self._audio_path(video_id)
+        tmp_path = path + '.part'
+        # Copy Opus as-is; anything else is transcoded to a compact Opus stream
+        codec = ['-c:a', 'copy'] if track.passthrough else ['-c:a', 'libopus', '-b:a', '96k']
+        try:
+            process = await asyncio.create_subprocess_exec(
+                'ffmpeg', '-y', '-loglevel', 'error',
+                '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+                '-i', track.url, '-vn', '-map_metadata', '-1', *codec, '-f', 'ogg', tmp_path,
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+            )
+            _, stderr = await process.communicate()
+            if process.returncode != 0:
+                raise RuntimeError(stderr.decode(errors='replace').strip())
+
+            os.replace(tmp_path, path)
+            sidecar = {field: getattr(track, field) for field in SIDECAR_FIELDS}
+            sidecar['id'] = video_id
+            with open(self._sidecar_path(video_id), 'w') as f:
+                json.dump(sidecar, f)
+
+            size = os.path.getsize(path)
+            self._files[video_id] = size
+            self.total_bytes += size
+            self.stores += 1
+            self._plays.pop(video_id, None)
+            print(f"💾 Cached audio for {track.title} ({size // 1024} KB)")
+            self._evict()
+        except Exception as e:
+            print(f"⚠️ Audio cache store failed for {video_id}: {e}")
+            try: os.remove(tmp_path)
+            except OSError: pass
+        finally:
+            self._storing.discard(video_id)
+
+    def _remove(self, video_id):
+        size = self._files.pop(video_id, 0)
+        self.total_bytes -= size
+        for path in (self._audio_path(video_id), self._sidecar_path(video_id)):
+            try: os.remove(path)
+            except OSError: pass
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._files:
+            video_id = next(iter(self._files))
+            self._remove(video_id)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'files': len(self._files),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'evictions': self.evictions,
+        }
+
+
+audio_cache = AudioCache(
+    config.AUDIO_CACHE_DIR,
+    config.AUDIO_CACHE_MAX_BYTES,
+    min_plays=config.AUDIO_CACHE_MIN_PLAYS,
+    enabled=config.AUDIO_CACHE_ENABLED,
+    max_tracked=config.AUDIO_CACHE_TRACKED_PLAYS,
+)
+metrics.add_collector("lyra_audio_cache", "On-disk audio cache counters", audio_cache.stats)
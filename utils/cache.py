@@ -0,0 +1,239 @@
+import asyncio
+import sqlite3
+import time
+import re
+import urllib.parse
+import concurrent.futures
+from collections import OrderedDict
+import config
+from utils.metrics import metrics
+
+YOUTUBE_ID_RE = re.compile(
+    r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/)|youtu\.be/)([A-Za-z0-9_-]{11})'
+)
+
+# Query parameters that only track where a link was shared from
+TRACKING_PARAMS = ('si', 'feature', 'pp', 'ab_channel', 'fbclid', 'igshid')
+
+# Info dict keys that are large and never read after the stream URL has been picked
+HEAVY_KEYS = ('formats', 'requested_formats', 'thumbnails', 'automatic_captions', 'subtitles', 'heatmap')
+
+
+def canonical_video_id(url):
+    """Return the YouTube video ID for a URL, or None if it isn't a single-video link."""
+    if not url:
+        return None
+    match = YOUTUBE_ID_RE.search(url)
+    return match.group(1) if match else None
+
+
+def normalize_link(url):
+    """Key for "the same link": scheme/host case, fragments, `www.` and tracking parameters ignored."""
+    parts = urllib.parse.urlsplit(url.strip())
+    host = re.sub(r'^(www|m)\.', '', parts.netloc.lower())
+    query = sorted(
+        (key, value) for key, value in urllib.parse.parse_qsl(parts.query)
+        if key not in TRACKING_PARAMS and not key.startswith('utm_')
+    )
+    return urllib.parse.urlunsplit(('https', host, parts.path.rstrip('/'), urllib.parse.urlencode(query), ''))
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one.
+
+    Callers arriving while a call for their key is running await that call's
+    result instead of starting their own; nothing is kept once it finishes.
+    The shared call is only cancelled when every caller waiting on it is.
+    """
+
+    def __init__(self):
+        self._calls = {} # key -> [task, waiters]
+        self.calls = 0
+        self.joined = 0
+
+    async def run(self, key, factory):
+        """Await `factory()`, or the in-flight call for `key` if there is one. A None key is never shared."""
+        if key is None:
+            return await factory()
+        call = self._calls.get(key)
+        if call is None:
+            task = asyncio.ensure_future(factory())
+            call = self._calls[key] = [task, 0]
+            task.add_done_callback(lambda done: self._calls.pop(key, None) if self._calls.get(key) is call else None)
+            self.calls += 1
+        else:
+            self.joined += 1
+        call[1] += 1
+        try:
+            return await asyncio.shield(call[0])
+        finally:
+            call[1] -= 1
+            if call[1] == 0 and not call[0].done():
+                call[0].cancel()
+
+    def stats(self):
+        return {
+            'in_flight': len(self._calls),
+            'calls': self.calls,
+            'joined': self.joined,
+        }
+
+
+def stream_url_expiry(stream_url):
+    """Read the `expire` timestamp googlevideo puts on stream URLs, if present."""
+    try:
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(stream_url).query)
+        return float(query['expire'][0])
+    except (KeyError, IndexError, ValueError, TypeError):
+        return None
+
+
+class ResolutionCache:
+    """LRU cache of resolved yt-dlp info keyed by video ID.
+
+    Entries live until shortly before their stream URL expires (or `default_ttl`
+    when the URL carries no expiry), then count as misses and get refreshed.
+
+    With a `shared` store (a MetadataCache on a file every cluster worker
+    opens), entries are written through to it and memory misses are looked up
+    there, so one process's extraction serves the others. The store is only
+    touched from one background thread, in call order, and its errors count as
+    misses or skipped writes: a locked or broken store never fails playback.
+    """
+
+    def __init__(self, max_entries=512, default_ttl=1800, expiry_margin=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.expiry_margin = expiry_margin
+        self._entries = OrderedDict() # video_id -> (expires_at, data)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.shared = None
+        self.shared_hits = 0
+        self.shared_errors = 0
+        self._shared_executor = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, video_id):
+        """In-memory lookup; see `get_shared` for the cluster-wide store."""
+        entry = self._entries.get(video_id) if video_id else None
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, data = entry
+        if time.time() >= expires_at:
+            del self._entries[video_id]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(video_id)
+        self.hits += 1
+        return dict(data)
+
+    def _expires_at(self, data):
+        expire = stream_url_expiry(data['url'])
+        if expire is None:
+            return time.time() + self.default_ttl
+        return expire - self.expiry_margin
+
+    def _store(self, video_id, data):
+        """Insert into the in-memory LRU. Returns the expiry, or None if the entry is already stale."""
+        expires_at = self._expires_at(data)
+        if expires_at <= time.time():
+            return None
+        self._entries[video_id] = (expires_at, data)
+        self._entries.move_to_end(video_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return expires_at
+
+    async def get_shared(self, video_id):
+        """Look a memory miss up in the shared store, off the event loop. None if absent or unavailable."""
+        if self.shared is None or not video_id:
+            return None
+        loop = asyncio.get_running_loop()
+        found, data = await loop.run_in_executor(self._executor(), self._shared_call, 'get', video_id)
+        if not (found and data and data.get('url')) or self._store(video_id, data) is None:
+            return None
+        self.shared_hits += 1
+        return dict(data)
+
+    def _executor(self):
+        if self._shared_executor is None:
+            self._shared_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='lyra-shared-cache'
+            )
+        return self._shared_executor
+
+    def _shared_call(self, method, *args, **kwargs):
+        try:
+            return getattr(self.shared, method)(*args, **kwargs)
+        except sqlite3.Error as e:
+            self.shared_errors += 1
+            print(f"⚠️ Shared resolution store {method} failed: {e}")
+            return (False, None) if method == 'get' else None
+
+    def _write_shared(self, method, *args, **kwargs):
+        """Queue a write to the shared store without waiting for it."""
+        if self.shared is None:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._shared_call(method, *args, **kwargs)
+            return
+        self._executor().submit(self._shared_call, method, *args, **kwargs)
+
+    def _put_shared(self, video_id, data, expires_at):
+        self._write_shared('put', video_id, data, ttl=expires_at - time.time())
+
+    def put(self, video_id, data):
+        if not video_id or not data.get('url'):
+            return
+
+        slim = {k: v for k, v in data.items() if k not in HEAVY_KEYS}
+        expires_at = self._store(video_id, slim)
+        if expires_at is not None:
+            self._put_shared(video_id, slim, expires_at)
+
+    def update(self, video_id, fields):
+        """Merge `fields` into a cached entry, keeping its expiry. No-op if it isn't cached."""
+        entry = self._entries.get(video_id) if video_id else None
+        if entry is not None:
+            entry[1].update(fields)
+            self._put_shared(video_id, entry[1], entry[0])
+
+    def invalidate(self, video_id):
+        self._entries.pop(video_id, None)
+        if video_id:
+            self._write_shared('delete', video_id)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'shared_hits': self.shared_hits,
+            'shared_errors': self.shared_errors,
+        }
+
+
+resolution_cache = ResolutionCache(
+    max_entries=config.RESOLVE_CACHE_SIZE,
+    default_ttl=config.RESOLVE_CACHE_TTL,
+    expiry_margin=config.RESOLVE_CACHE_EXPIRY_MARGIN,
+)
+metrics.add_collector("lyra_resolution_cache", "yt-dlp resolution cache counters", resolution_cache.stats)
@@ -0,0 +1,110 @@
+import json
+import multiprocessing
+import signal
+import time
+import urllib.request
+import config
+
+GATEWAY_BOT_URL = "https://discord.com/api/v10/gateway/bot"
+
+
+def recommended_shard_count(token):
+    """Ask Discord how many shards this bot should run."""
+    request = urllib.request.Request(GATEWAY_BOT_URL, headers={'Authorization': f"Bot {token}"})
+    with urllib.request.urlopen(request, timeout=config.HTTP_TIMEOUT) as response:
+        return json.load(response)['shards']
+
+
+def shard_for(guild_id, shard_count):
+    """The gateway shard a guild's events arrive on."""
+    return (guild_id >> 22) % shard_count
+
+
+def shard_ranges(shard_count, workers):
+    """Split shard IDs 0..shard_count-1 into `workers` contiguous, near-equal ranges."""
+    workers = max(1, min(workers, shard_count))
+    size, extra = divmod(shard_count, workers)
+    ranges, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+class Supervisor:
+    """Runs the bot as several processes, each owning a range of gateway shards.
+
+    Every worker is a full bot (own event loop, voice encoding, FFmpeg and
+    extraction pool), so throughput scales with cores. Workers share the
+    SQLite metadata/resolution store. A worker that exits is restarted with
+    exponential backoff, reset once it has stayed up for `stable_after` seconds.
+    """
+
+    def __init__(self, target, workers, shard_count=None, stable_after=60, max_backoff=60):
+        self.target = target # target(cluster_id, shard_ids, shard_count), run in each worker
+        self.workers = workers
+        self.shard_count = shard_count
+        self.stable_after = stable_after
+        self.max_backoff = max_backoff
+        self.stopping = False
+        self._context = multiprocessing.get_context('spawn')
+        self._procs = {} # cluster_id -> (process, started_at)
+        self._backoff = {} # cluster_id -> seconds to wait before the next restart
+        self._restart_at = {} # cluster_id -> monotonic time of the pending restart
+
+    def _start(self, cluster_id, shard_ids, shard_count):
+        proc = self._context.Process(
+            target=self.target, args=(cluster_id, shard_ids, shard_count), name=f"lyra-cluster-{cluster_id}"
+        )
+        proc.start()
+        self._procs[cluster_id] = (proc, time.monotonic())
+        print(f"🧩 Cluster {cluster_id}: started (pid {proc.pid}, shards {shard_ids[0]}-{shard_ids[-1]})")
+
+    def _stop(self, *args):
+        self.stopping = True
+
+    def run(self):
+        shard_count = self.shard_count or recommended_shard_count(config.TOKEN)
+        ranges = shard_ranges(shard_count, self.workers)
+        print(f"🧩 Running {shard_count} shards in {len(ranges)} processes")
+
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        for cluster_id, shard_ids in enumerate(ranges):
+            self._start(cluster_id, shard_ids, shard_count)
+
+        try:
+            while not self.stopping:
+                time.sleep(1)
+                self._check(ranges, shard_count)
+        finally:
+            self._shutdown()
+
+    def _check(self, ranges, shard_count):
+        now = time.monotonic()
+        for cluster_id, (proc, started_at) in list(self._procs.items()):
+            if proc.is_alive():
+                if now - started_at >= self.stable_after:
+                    self._backoff.pop(cluster_id, None)
+                continue
+
+            restart_at = self._restart_at.get(cluster_id)
+            if restart_at is None:
+                delay = self._backoff.get(cluster_id, 1)
+                self._backoff[cluster_id] = min(delay * 2, self.max_backoff)
+                self._restart_at[cluster_id] = now + delay
+                print(f"⚠️ Cluster {cluster_id}: exited with code {proc.exitcode}, restarting in {delay}s")
+            elif now >= restart_at:
+                del self._restart_at[cluster_id]
+                self._start(cluster_id, ranges[cluster_id], shard_count)
+
+    def _shutdown(self):
+        print("👋 Stopping clusters...")
+        for proc, _ in self._procs.values():
+            if proc.is_alive():
+                proc.terminate()
+        for proc, _ in self._procs.values():
+            proc.join(timeout=10)
+            if proc.is_alive():
+                proc.kill()
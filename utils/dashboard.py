@@ -0,0 +1,89 @@
+import asyncio
+import json
+import os
+import time
+from utils.metrics import metrics
+
+
+def load_dashboard_ids(path):
+    """channel_id -> dashboard message_id, as recorded by `save_dashboard_id`."""
+    try:
+        with open(path, encoding='utf-8') as file:
+            return {int(channel_id): message_id for channel_id, message_id in json.load(file).items()}
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_dashboard_id(path, channel_id, message_id):
+    ids = load_dashboard_ids(path)
+    if ids.get(channel_id) == message_id:
+        return
+    ids[channel_id] = message_id
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump({str(key): value for key, value in ids.items()}, file)
+    os.replace(tmp_path, path)
+
+
+class DashboardRenderer:
+    """Coalesces dashboard refreshes for one player into rate-limited message edits.
+
+    Any number of `request()` calls between two edits collapse into a single
+    edit, at most one per `interval` seconds. Edits whose embed is identical to
+    the last one sent are skipped, and the persistent view is only attached
+    once per message instead of being rebuilt on every refresh.
+    """
+
+    def __init__(self, player, interval=2.0):
+        self.player = player
+        self.interval = interval
+        self._dirty = False
+        self._task = None
+        self._last_edit = 0
+        self._last_payload = None
+        self._view_sent = False
+        self.edits = 0
+        self.skipped = 0
+
+    def reset(self, embed=None, view_sent=False):
+        """Forget what was last rendered, e.g. after the dashboard message changed."""
+        self._last_payload = embed.to_dict() if embed else None
+        self._view_sent = view_sent
+
+    def request(self):
+        """Mark the dashboard stale. Must be called on the event loop."""
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = self.player.bot.loop.create_task(self._run())
+
+    async def _run(self):
+        while self._dirty:
+            wait = self._last_edit + self.interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._dirty = False
+            try:
+                await self._render()
+            except Exception as e:
+                print(f"⚠️ ERROR in update_dashboard: {e}")
+
+    async def _render(self):
+        message = self.player.dashboard_message
+        if not message:
+            return
+
+        embed = self.player.create_dashboard_embed()
+        payload = embed.to_dict()
+        if payload == self._last_payload and self._view_sent:
+            self.skipped += 1
+            return
+
+        kwargs = {'embed': embed}
+        if not self._view_sent:
+            kwargs['view'] = self.player.cog.view
+        self._last_edit = time.monotonic()
+        with metrics.timer("lyra_dashboard_edit_seconds"):
+            await message.edit(**kwargs)
+        self.edits += 1
+        self._last_payload = payload
+        self._view_sent = True
@@ -0,0 +1,241 @@
+import asyncio
+import itertools
+import threading
+import time
+import concurrent.futures
+from utils.metrics import metrics
+
+# Priority lanes: lower runs first
+PRIORITY_PLAY = 0 # A user is waiting for this track to start
+PRIORITY_BACKGROUND = 1 # Prefetch and playlist entries
+
+_local = threading.local()
+
+yt_dlp = None # Imported on first use, see load_yt_dlp
+
+
+def load_yt_dlp():
+    """Import yt-dlp on first use instead of at startup; it is the heaviest import in the bot."""
+    global yt_dlp
+    if yt_dlp is None:
+        import yt_dlp as module
+        # Suppress noise from youtube_dl and bug reports
+        module.utils.bug_reports_message = lambda *args, **kwargs: ''
+        yt_dlp = module
+    return yt_dlp
+
+
+def _worker_init(options):
+    # Runs once per worker thread/process, so every worker owns its own YoutubeDL
+    _local.ytdl = load_yt_dlp().YoutubeDL(options)
+    _local.pagers = {}
+    _local.next_token = itertools.count()
+
+
+def _worker_extract(url, download, process, materialize, page_size):
+    data = _local.ytdl.extract_info(url, download=download, process=process)
+    if data and 'entries' in data:
+        if page_size:
+            # Keep the (lazy) entries iterator inside this worker and hand out only the first page
+            entries = iter(data['entries'])
+            data['entries'] = list(itertools.islice(entries, page_size))
+            if len(data['entries']) == page_size:
+                token = next(_local.next_token)
+                _local.pagers[token] = entries
+                data['_pager_token'] = token
+        elif materialize:
+            # Generators don't survive pickling across the process boundary
+            data['entries'] = list(data['entries'])
+    return data
+
+
+def _worker_next_page(token, page_size):
+    entries = _local.pagers.get(token)
+    if entries is None:
+        return []
+    page = list(itertools.islice(entries, page_size))
+    if len(page) < page_size:
+        del _local.pagers[token]
+    return page
+
+
+def _worker_close_pager(token):
+    _local.pagers.pop(token, None)
+
+
+def _worker_ready():
+    # Nothing to do: getting here means _worker_init already built this worker's YoutubeDL
+    return True
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+class Pager:
+    """Handle to a playlist entries iterator that lives inside one worker."""
+
+    def __init__(self, worker, token):
+        self.worker = worker
+        self.executor = worker.executor
+        self.token = token
+
+    @property
+    def alive(self):
+        # A replaced (timed out) worker takes its iterators with it
+        return self.executor is self.worker.executor
+
+
+class _Worker:
+    """One dedicated executor (single thread or single process) with its own YoutubeDL."""
+
+    def __init__(self, options, mode):
+        self.options = options
+        self.mode = mode
+        self.executor = self._new_executor()
+
+    def _new_executor(self):
+        if self.mode == 'process':
+            return concurrent.futures.ProcessPoolExecutor(
+                max_workers=1, initializer=_worker_init, initargs=(self.options,)
+            )
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='lyra-extract', initializer=_worker_init, initargs=(self.options,)
+        )
+
+    def submit(self, url, download, process, page_size=None):
+        return self.executor.submit(_worker_extract, url, download, process, self.mode == 'process', page_size)
+
+    def replace(self):
+        """Abandon a stuck executor and start a fresh one so later jobs aren't stalled behind it."""
+        old = self.executor
+        self.executor = self._new_executor()
+        if self.mode == 'process':
+            for proc in list(getattr(old, '_processes', {}).values()):
+                proc.terminate()
+        old.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ExtractionPool:
+    """Bounded, prioritized pool of yt-dlp workers.
+
+    Jobs wait in a priority queue (play-now before background) holding at most
+    `queue_size` entries; submitters block once it is full. Each job has a
+    timeout, after which its worker is replaced instead of stalling the pool.
+    """
+
+    def __init__(self, options, *, workers=4, mode='thread', queue_size=256, timeout=30):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f"Unknown extraction pool mode: {mode}")
+        self.options = options
+        self.size = workers
+        self.mode = mode
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._queue = None
+        self._workers = []
+        self._dispatchers = []
+        self._seq = itertools.count()
+        self.completed = 0
+        self.timeouts = 0
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.PriorityQueue(maxsize=self.queue_size)
+        for _ in range(self.size):
+            worker = _Worker(self.options, self.mode)
+            self._workers.append(worker)
+            self._dispatchers.append(loop.create_task(self._dispatch(worker)))
+
+    @property
+    def pending(self):
+        return self._queue.qsize() if self._queue else 0
+
+    async def warm_up(self):
+        """Start every worker now (importing yt-dlp and building its YoutubeDL) instead of on the first request."""
+        if self._queue is None:
+            self._start()
+        await asyncio.gather(*(asyncio.wrap_future(worker.executor.submit(_worker_ready)) for worker in self._workers))
+
+    async def extract(self, url, *, download=False, process=True, priority=PRIORITY_PLAY, timeout=None, page_size=None):
+        """Run `YoutubeDL.extract_info` on a pool worker and return the info dict.
+
+        With `page_size`, a playlist's entries are cut to the first page and, if
+        more may follow, `data['_pager']` holds a Pager for `next_page`.
+        """
+        if self._queue is None:
+            self._start()
+        future = asyncio.get_running_loop().create_future()
+        job = (url, download, process, page_size, timeout or self.timeout, time.monotonic(), future)
+        await self._queue.put((priority, next(self._seq), job))
+        worker, data = await future
+        if data and '_pager_token' in data:
+            data['_pager'] = Pager(worker, data.pop('_pager_token'))
+        return data
+
+    async def next_page(self, pager, page_size, timeout=None):
+        """Pull the next `page_size` entries from a playlist. Returns [] once exhausted."""
+        if not pager.alive:
+            return []
+        job = asyncio.wrap_future(pager.executor.submit(_worker_next_page, pager.token, page_size))
+        try:
+            return await asyncio.wait_for(job, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            pager.worker.replace()
+            raise ExtractionTimeout(f"Playlist page timed out after {timeout or self.timeout}s")
+
+    def close_pager(self, pager):
+        if pager.alive:
+            pager.executor.submit(_worker_close_pager, pager.token)
+
+    async def _dispatch(self, worker):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, (url, download, process, page_size, timeout, queued_at, future) = await self._queue.get()
+            try:
+                if future.cancelled():
+                    continue
+                metrics.observe("lyra_extract_queue_wait_seconds", time.monotonic() - queued_at)
+                job = asyncio.wrap_future(worker.submit(url, download, process, page_size), loop=loop)
+                try:
+                    result = await asyncio.wait_for(job, timeout)
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    metrics.inc("lyra_extract_timeouts_total")
+                    worker.replace()
+                    if not future.done():
+                        future.set_exception(ExtractionTimeout(f"Extraction timed out after {timeout}s: {url}"))
+                except Exception as e:
+                    metrics.inc("lyra_extract_errors_total")
+                    if 'HTTP Error 429' in str(e):
+                        metrics.inc("lyra_http_429_total", service="youtube")
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    self.completed += 1
+                    if not future.done():
+                        future.set_result((worker, result))
+            finally:
+                self._queue.task_done()
+
+    def shutdown(self):
+        for task in self._dispatchers:
+            task.cancel()
+        for worker in self._workers:
+            worker.shutdown()
+        self._dispatchers = []
+        self._workers = []
+        self._queue = None
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'workers': self.size,
+            'pending': self.pending,
+            'completed': self.completed,
+            'timeouts': self.timeouts,
+        }
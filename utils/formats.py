@@ -0,0 +1,70 @@
+import config
+from utils.metrics import metrics
+
+# Per-format fields kept with a cached resolution; the rest of yt-dlp's format dicts is dropped
+FORMAT_KEYS = ('format_id', 'url', 'acodec', 'abr', 'protocol')
+
+
+def _is_audio_only(fmt):
+    return (
+        fmt.get('url')
+        and fmt.get('abr')
+        and fmt.get('acodec') not in (None, 'none')
+        and fmt.get('vcodec') in (None, 'none')
+        and fmt.get('protocol', 'https') in ('http', 'https')
+    )
+
+
+def audio_formats(info):
+    """The audio-only, directly streamable formats of a yt-dlp info dict, slimmed down for caching."""
+    return [
+        {key: fmt[key] for key in FORMAT_KEYS if key in fmt}
+        for fmt in info.get('formats') or () if _is_audio_only(fmt)
+    ]
+
+
+def pick_format(formats, bitrate, prefer_codec=None):
+    """The smallest format of at least `bitrate` kbps, or the largest one if none reaches it.
+
+    A format in `prefer_codec` wins over any other that also reaches the bitrate,
+    since it can be played without transcoding.
+    """
+    if not formats:
+        return None
+    preferred = lambda fmt: fmt.get('acodec') == prefer_codec
+    enough = [fmt for fmt in formats if fmt['abr'] >= bitrate]
+    if enough:
+        return min(enough, key=lambda fmt: (not preferred(fmt), fmt['abr']))
+    return max(formats, key=lambda fmt: (preferred(fmt), fmt['abr']))
+
+
+def select_stream(data, bitrate, start_at=0):
+    """Point `data` at the stream format matching a voice channel of `bitrate` bits/s.
+
+    Returns a new dict (cached resolutions are shared between guilds) and the
+    choice as {'format_id', 'acodec', 'abr'}, or None when there was nothing to
+    choose from (local files, entries cached without their formats). Only plays
+    from the start are counted in the metrics; seeks, resumes and restores
+    reopen a stream that was already counted.
+    """
+    formats = data.get('audio_formats')
+    if not bitrate or not formats or data.get('is_local'):
+        return data, None
+
+    prefer_codec = 'opus' if config.PLAYBACK_MODE == 'opus' else None
+    fmt = pick_format(formats, bitrate / 1000 * config.STREAM_BITRATE_HEADROOM, prefer_codec)
+    data = {**data, 'url': fmt['url'], 'acodec': fmt['acodec'], 'abr': fmt['abr'], 'format_id': fmt.get('format_id')}
+    choice = {'format_id': fmt.get('format_id'), 'acodec': fmt['acodec'], 'abr': fmt['abr']}
+
+    if start_at:
+        return data, choice
+
+    # What the extractor's own pick would have pulled, against what this one pulls
+    baseline = data.get('baseline_abr') or max(f['abr'] for f in formats)
+    metrics.inc("lyra_stream_format_total", acodec=fmt['acodec'])
+    if data.get('duration'):
+        kbits_to_bytes = 1000 / 8 * float(data['duration'])
+        metrics.inc("lyra_stream_bytes_total", int(fmt['abr'] * kbits_to_bytes))
+        if baseline > fmt['abr']:
+            metrics.inc("lyra_stream_bytes_saved_total", int((baseline - fmt['abr']) * kbits_to_bytes))
+    return data, choice
@@ -0,0 +1,25 @@
+import aiohttp
+import config
+
+_session = None
+
+
+def get_session():
+    """Return the process-wide pooled HTTP session, creating it on first use."""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=config.HTTP_POOL_LIMIT,
+            limit_per_host=config.HTTP_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=300,
+        )
+        timeout = aiohttp.ClientTimeout(total=config.HTTP_TIMEOUT, connect=config.HTTP_CONNECT_TIMEOUT)
+        _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -0,0 +1,148 @@
+import os
+import json
+import threading
+from collections import deque
+from utils.metrics import metrics
+
+
+def track_entry(track):
+    """The fields needed to bring a track back as a LazySource, without its (expiring) stream URL."""
+    entry = {
+        'url': track.webpage_url or track.url,
+        'title': track.title,
+        'duration': track.duration,
+        'uploader': track.uploader,
+        'thumbnail': track.thumbnail,
+        'requester_id': track.requester_id,
+    }
+    if track.enriched:
+        entry['enriched'] = True
+    return {key: value for key, value in entry.items() if value is not None}
+
+
+def empty_state():
+    return {
+        'voice_channel_id': None,
+        'text_channel_id': None,
+        'loop_mode': 0,
+        'current': None,
+        'position': 0,
+        'queue': [],
+    }
+
+
+class QueueJournal:
+    """Append-only log of one guild's player state, replayed on startup.
+
+    Every line is one JSON record. Queue edits are written as small deltas
+    (extend, popleft, ...); anything that reorders the queue, and every
+    `compact_every` records, rewrites the file as a single snapshot taken from
+    `snapshot_fn`. Records may come from the voice thread, so writes are
+    serialized. A torn last line left by a crash is skipped on replay.
+    """
+
+    def __init__(self, path, snapshot_fn, compact_every=1000):
+        self.path = path
+        self.snapshot_fn = snapshot_fn
+        self.compact_every = compact_every
+        self.records = 0
+        self.closed = False
+        self._file = None
+        self._lock = threading.RLock()
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    def record(self, op, **fields):
+        with self._lock:
+            if self.closed:
+                return
+            file = self._open()
+            file.write(json.dumps({'op': op, **fields}, separators=(',', ':')) + '\n')
+            file.flush()
+            self.records += 1
+            metrics.inc("lyra_journal_records_total")
+            if self.records >= self.compact_every:
+                self.compact()
+
+    def queue_changed(self, op, tracks=()):
+        """TrackQueue hook. Reorders are cheaper to snapshot than to describe."""
+        if op == 'reorder':
+            self.compact()
+        elif tracks:
+            self.record(op, tracks=[track_entry(track) for track in tracks])
+        else:
+            self.record(op)
+
+    def compact(self):
+        """Replace the log with one snapshot of the current state."""
+        with self._lock:
+            if self.closed:
+                return
+            state = self.snapshot_fn()
+            tmp_path = f"{self.path}.tmp"
+            with metrics.timer("lyra_journal_compact_seconds"):
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with open(tmp_path, 'w', encoding='utf-8') as tmp:
+                    tmp.write(json.dumps({'op': 'snapshot', 'state': state}, separators=(',', ':')) + '\n')
+                    tmp.flush()
+                    os.fsync(tmp.fileno())
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                os.replace(tmp_path, self.path)
+            self.records = 0
+
+    def close(self):
+        """Stop recording; anything that happens after this (e.g. shutdown) is not journaled."""
+        with self._lock:
+            self.closed = True
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    @staticmethod
+    def load(path):
+        """Replay a journal file into a state dict (see `empty_state`). Returns None if there is none."""
+        try:
+            with open(path, encoding='utf-8') as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            return None
+
+        state = empty_state()
+        queue = deque()
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Torn write from a crash; nothing after it was flushed either
+                break
+            op = record.get('op')
+            if op == 'snapshot':
+                state = {**empty_state(), **record['state']}
+                queue = deque(state['queue'])
+            elif op == 'extend':
+                queue.extend(record['tracks'])
+            elif op == 'appendleft':
+                queue.extendleft(reversed(record['tracks']))
+            elif op == 'popleft':
+                if queue:
+                    queue.popleft()
+            elif op == 'clear':
+                queue.clear()
+            elif op == 'current':
+                state['current'] = record.get('track')
+                state['position'] = record.get('position', 0)
+            elif op == 'position':
+                state['position'] = record['seconds']
+            elif op == 'loop':
+                state['loop_mode'] = record['mode']
+            elif op == 'voice':
+                state['voice_channel_id'] = record.get('channel_id')
+                state['text_channel_id'] = record.get('text_channel_id', state['text_channel_id'])
+        state['queue'] = list(queue)
+        return state
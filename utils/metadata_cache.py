@@ -0,0 +1,116 @@
+import sqlite3
+import json
+import time
+import re
+import threading
+import config
+from utils.metrics import metrics
+
+NOISE_RE = re.compile(r'[\(\[](official|video|lyrics|audio|mv|hq).*?[\)\]]', re.IGNORECASE)
+ARTIST_NOISE_RE = re.compile(r'(- )?(Topic|Official|VEVO|Channel)', re.IGNORECASE)
+PUNCT_RE = re.compile(r'[^\w\s]')
+SPACE_RE = re.compile(r'\s+')
+
+
+def normalize(text):
+    text = PUNCT_RE.sub(' ', text.lower())
+    return SPACE_RE.sub(' ', text).strip()
+
+
+def make_key(title, artist=None):
+    """Cache key for a lookup: normalized title and artist, noise words removed."""
+    title_key = normalize(NOISE_RE.sub('', title or ''))
+    artist_key = normalize(ARTIST_NOISE_RE.sub('', artist or ''))
+    return f"{title_key}|{artist_key}"
+
+
+class MetadataCache:
+    """SQLite-backed store of metadata enrichment results, including misses.
+
+    A hit is kept for `hit_ttl` seconds and a "no match" for `miss_ttl`, so tracks
+    that no provider knows stop costing round-trips but get retried eventually.
+    """
+
+    def __init__(self, path, hit_ttl=30 * 86400, miss_ttl=86400, table='metadata', timeout=None):
+        self.path = path
+        self.timeout = config.CACHE_DB_TIMEOUT if timeout is None else timeout # Seconds to wait for another writer's lock
+        self.table = table
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._db is None:
+            db = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            try:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                    " key TEXT PRIMARY KEY,"
+                    " payload TEXT,"
+                    " expires_at REAL NOT NULL)"
+                )
+            except sqlite3.Error:
+                # e.g. another process switching to WAL at the same time; retry on the next call
+                db.close()
+                raise
+            self._db = db
+        return self._db
+
+    def get(self, key):
+        """Return (found, metadata). `metadata` is None for a cached "no match"."""
+        with self._lock:
+            row = self._connect().execute(
+                f"SELECT payload, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, (json.loads(row[0]) if row[0] else None)
+
+    def put(self, key, metadata, ttl=None):
+        if ttl is None:
+            ttl = self.hit_ttl if metadata else self.miss_ttl
+        payload = json.dumps(metadata) if metadata else None
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, payload, expires_at) VALUES (?, ?, ?)",
+                (key, payload, time.time() + ttl),
+            )
+            db.commit()
+
+    def delete(self, key):
+        with self._lock:
+            db = self._connect()
+            db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            db.commit()
+
+    def purge_expired(self):
+        """Delete expired rows. Returns how many were removed."""
+        with self._lock:
+            db = self._connect()
+            removed = db.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),)).rowcount
+            db.commit()
+        return removed
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+metadata_cache = MetadataCache(
+    config.METADATA_CACHE_PATH,
+    hit_ttl=config.METADATA_CACHE_HIT_TTL,
+    miss_ttl=config.METADATA_CACHE_MISS_TTL,
+)
+metrics.add_collector("lyra_metadata_cache", "Metadata enrichment cache counters", metadata_cache.stats)
@@ -0,0 +1,190 @@
+import asyncio
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+import config
+
+# Upper bounds in seconds, from a single frame to a slow extraction
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (list(extra) if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self._series = {} # label key -> [bucket counts..., count, sum]
+
+    def observe(self, value, key=()):
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 2)
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-1]:.6f}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._series = {}
+
+    def inc(self, amount=1, key=()):
+        self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self._series.items():
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Registry:
+    """Process-wide histograms and counters, rendered in the Prometheus text format.
+
+    Recording is a dict lookup and a bisect under one lock, cheap enough to call
+    from the audio thread. Stats that already live elsewhere (cache counters)
+    are pulled in at render time through collectors instead of being duplicated.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help_text, buckets)
+            return self._metrics[name]
+
+    def counter(self, name, help_text):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help_text)
+            return self._metrics[name]
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            self._metrics[name].observe(value, _label_key(labels))
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            self._metrics[name].inc(amount, _label_key(labels))
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the enclosed block into histogram `name`. Works inside coroutines too."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def add_collector(self, name, help_text, stats_fn):
+        """Export `stats_fn()` (a dict of numbers) as gauge `name` with a `stat` label."""
+        self._collectors.append((name, help_text, stats_fn))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for metric in self._metrics.values():
+                lines.extend(metric.render())
+        for name, help_text, stats_fn in self._collectors:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for stat, value in stats_fn().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f'{name}{{stat="{stat}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Registry()
+
+# Pipeline stages
+metrics.histogram("lyra_extract_flat_seconds", "Flat (process=False) yt-dlp extraction time")
+metrics.histogram("lyra_extract_full_seconds", "Full yt-dlp extraction time")
+metrics.histogram("lyra_extract_queue_wait_seconds", "Time an extraction job waited for a worker")
+metrics.histogram("lyra_metadata_seconds", "Metadata provider request time")
+metrics.histogram("lyra_ffmpeg_spawn_seconds", "Time to spawn the FFmpeg reader for a track")
+metrics.histogram("lyra_first_frame_seconds", "Time from voice_client.play to the first audio frame read")
+metrics.histogram("lyra_dashboard_edit_seconds", "Dashboard message edit latency")
+metrics.histogram("lyra_player_command_seconds", "Time from posting a player command to it being handled")
+metrics.histogram("lyra_journal_compact_seconds", "Time to rewrite a queue journal as a snapshot")
+
+# Events
+metrics.counter("lyra_http_429_total", "HTTP 429 responses from upstream services")
+metrics.counter("lyra_short_track_total", "Tracks that ended within 10s without a manual skip")
+metrics.counter("lyra_extract_errors_total", "Failed extraction jobs")
+metrics.counter("lyra_extract_timeouts_total", "Extraction jobs that hit their timeout")
+metrics.counter("lyra_player_commands_dropped_total", "Player controls dropped because the control backlog was full")
+metrics.counter("lyra_journal_records_total", "Records appended to queue journals")
+metrics.counter("lyra_stream_format_total", "Stream formats picked for the voice channel bitrate, by codec")
+metrics.counter("lyra_stream_bytes_total", "Estimated bytes of the stream formats picked")
+metrics.counter("lyra_stream_bytes_saved_total", "Estimated bytes not pulled compared to the extractor's best audio format")
+
+
+async def _serve(host, port):
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"📈 Metrics available at http://{host}:{port}/metrics")
+    return runner
+
+
+async def _dump_periodically(path, interval):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(metrics.render())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Could not write metrics file: {e}")
+
+
+async def start_exporter():
+    """Start the /metrics endpoint and/or the periodic file dump, as configured."""
+    if config.METRICS_PORT:
+        try:
+            await _serve(config.METRICS_HOST, config.METRICS_PORT)
+        except OSError as e:
+            print(f"⚠️ Could not start metrics endpoint: {e}")
+    if config.METRICS_FILE:
+        asyncio.get_running_loop().create_task(_dump_periodically(config.METRICS_FILE, config.METRICS_DUMP_INTERVAL))
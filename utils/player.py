@@ -0,0 +1,596 @@
+import discord
+import config
+import asyncio
+import traceback
+import time
+import os
+from utils.audio import YTDLSource, LazySource, enrich_track
+from utils.dashboard import DashboardRenderer
+from utils.track_queue import TrackQueue
+from utils.audio_cache import audio_cache
+from utils.cache import canonical_video_id, resolution_cache
+from utils.metrics import metrics
+from utils.journal import QueueJournal, track_entry
+
+
+class GuildPlayer:
+    """Playback state for a single guild: queue, voice client, loop mode and dashboard.
+
+    Queue and playback state belong to one command-processor task per player.
+    Callers post commands (`enqueue`, `control`) instead of mutating state, so
+    button presses, new links and the audio thread's "track finished" are
+    applied one at a time, in order. Handlers never wait on extraction, which
+    keeps control latency to a loop iteration or two.
+    """
+
+    def __init__(self, cog, guild_id):
+        self.cog = cog
+        self.bot = cog.bot
+        self.guild_id = guild_id
+        self.queue = TrackQueue()
+        self.current_track = None
+        self.voice_client = None
+        self.dashboard_message = None
+        self.dashboard_channel = None
+        self.loop_mode = 0 # 0=Off, 1=Track, 2=Queue
+        self.start_time = 0
+        self.manual_skip = False
+        self.prefetching = [] # LazySource entries currently being resolved ahead of time
+        self.renderer = DashboardRenderer(self, interval=config.DASHBOARD_MIN_INTERVAL)
+        self._up_next_cache = (None, None) # (queue revision, rendered field)
+        self.ingests = [] # PlaylistIngest streams still adding entries to the queue
+        self.journal = None
+        if config.JOURNAL_ENABLED:
+            path = os.path.join(config.JOURNAL_DIR, f"{guild_id}.jsonl")
+            self.journal = QueueJournal(path, self.journal_state, compact_every=config.JOURNAL_COMPACT_EVERY)
+            self.queue.journal = self.journal
+        # Command processor (see `_run`): internal events, then controls, then enqueues.
+        # Events are never dropped; enqueuers wait once PLAYER_ENQUEUE_BACKLOG are pending
+        self._events = asyncio.Queue()
+        self._controls = asyncio.Queue(maxsize=config.PLAYER_CONTROL_BACKLOG)
+        self._enqueues = asyncio.Queue(maxsize=config.PLAYER_ENQUEUE_BACKLOG)
+        self._wakeup = asyncio.Event()
+        self._actor = None
+        self._starting = None # LazySource being resolved to play next
+        self._replacing = None # Playing track that `_starting` will take over from (seek)
+        self._continuing = False # `_starting` continues the last listen (resume, restore) rather than starting one
+        self.resume_attempts = 0 # Stream-failure resumes of the current track so far
+
+    @property
+    def is_idle(self):
+        return not self.current_track and self._starting is None and not self.queue and not self.voice_client
+
+    @property
+    def position(self):
+        """Seconds into the current track. Counted in played frames, so pauses don't advance it."""
+        track = self.current_track
+        if isinstance(track, YTDLSource):
+            return track.position
+        # Not playing yet (e.g. restored and still resolving): wall clock from the saved offset
+        return time.time() - self.start_time if track else 0
+
+    @property
+    def bitrate(self):
+        """The voice channel's bitrate in bits/s, which stream formats are picked for."""
+        channel = getattr(self.voice_client, 'channel', None)
+        return getattr(channel, 'bitrate', None)
+
+    def _record(self, op, **fields):
+        if self.journal:
+            self.journal.record(op, **fields)
+
+    def journal_state(self):
+        """Full snapshot for the queue journal."""
+        channel = getattr(self.voice_client, 'channel', None)
+        return {
+            'voice_channel_id': channel.id if channel and self.voice_client.is_connected() else None,
+            'text_channel_id': self.dashboard_channel.id if self.dashboard_channel else None,
+            'loop_mode': self.loop_mode,
+            'current': track_entry(self.current_track) if self.current_track else None,
+            'position': round(self.position, 1),
+            'queue': [track_entry(track) for track in list(self.queue)],
+        }
+
+    def checkpoint(self):
+        """Journal the playback position so a restart resumes close to where it left off."""
+        if self.current_track and self.voice_client and (self.voice_client.is_playing() or self.voice_client.is_paused()):
+            self._record('position', seconds=round(self.position, 1))
+
+    async def connect(self, channel, text_channel=None):
+        self.voice_client = await channel.connect()
+        self._record('voice', channel_id=channel.id, text_channel_id=text_channel.id if text_channel else None)
+
+    async def restore(self, state):
+        """Rebuild a journaled player: queue entries as LazySource records, voice, and the
+        current track resumed from its saved offset. Only that one track is resolved now;
+        the rest resolve on demand like any other queued entry.
+        """
+        channel = self.bot.get_channel(state['voice_channel_id']) if state['voice_channel_id'] else None
+        if channel is not None:
+            try:
+                self.voice_client = await channel.connect()
+            except Exception as e:
+                print(f"⚠️ [{self.guild_id}] Could not rejoin voice: {e}")
+        self._post('restore', state)
+
+    def create_dashboard_embed(self):
+        embed = discord.Embed(title="Lyra Player 🎵", color=config.COLOR_MAIN)
+        
+        if self.current_track:
+            status = "Now Playing ▶️"
+            if self.voice_client and self.voice_client.is_paused():
+                status = "Paused ⏸️"
+            
+            requester = self.current_track.requester_mention
+            
+            # Title and Artist
+            description = f"**{self.current_track.title}**\n*{self.current_track.uploader}*"
+            embed.add_field(name=status, value=description, inline=False)
+            
+            # Inline fields for Duration and Requester
+            embed.add_field(name="Duration", value=self.current_track.formatted_duration, inline=True)
+            embed.add_field(name="Requested by", value=requester, inline=True)
+            
+            if self.current_track.thumbnail:
+                embed.set_thumbnail(url=self.current_track.thumbnail)
+        else:
+            embed.description = "No track playing. Paste a link to start!"
+            embed.add_field(name="Status", value="Idle", inline=False)
+
+        if self.queue:
+            name, up_next = self._render_up_next()
+            embed.add_field(name=name, value=up_next, inline=False)
+
+        if self.ingests:
+            lines = [f"📥 **{ingest.title}**: {ingest.added} tracks added..." for ingest in self.ingests]
+            embed.add_field(name="Loading playlist", value="\n".join(lines), inline=False)
+
+        if self.loop_mode == 1:
+            embed.set_footer(text="🔂 Loop: Track")
+        elif self.loop_mode == 2:
+            embed.set_footer(text="🔁 Loop: Queue")
+        
+        return embed
+
+    def _render_up_next(self):
+        revision, field = self._up_next_cache
+        if revision == self.queue.revision:
+            return field
+
+        # Total queue duration is maintained by the queue itself
+        m, s = divmod(self.queue.total_duration, 60)
+        h, m = divmod(m, 60)
+        if h > 0:
+            total_duration = f"{h}h {m}m"
+        else:
+            total_duration = f"{m}m {s}s"
+
+        queue_list = []
+        for i, t in enumerate(self.queue.head(10)):
+            req = t.requester_mention
+            title = t.title
+            if len(title) > 30:
+                title = title[:27] + "..."
+            queue_list.append(f"`{i+1}.` **{title}** ({t.formatted_duration}) • {req}")
+        
+        up_next = "\n".join(queue_list)
+        if len(self.queue) > 10:
+            up_next += f"\n\n**+ {len(self.queue)-10} more tracks in queue...**"
+
+        field = (f"Up Next (Total: {total_duration})", up_next)
+        self._up_next_cache = (self.queue.revision, field)
+        return field
+
+    async def update_dashboard(self):
+        # Coalesced and rate limited; the actual edit happens in the renderer
+        self.renderer.request()
+
+    async def send_notification(self, text, color=config.COLOR_MAIN, delete_after=10):
+        if self.dashboard_channel:
+            try:
+                embed = discord.Embed(description=text, color=color)
+                await self.dashboard_channel.send(embed=embed, delete_after=delete_after)
+            except Exception as e:
+                print(f"⚠️ Error sending notification: {e}")
+
+    def enrich(self, track):
+        """Start background metadata enrichment; the dashboard refreshes if it changes anything."""
+        if track.enriched:
+            return
+        self.bot.loop.create_task(self._enrich(track))
+
+    async def _enrich(self, track):
+        try:
+            if not await enrich_track(track):
+                return
+        except Exception as e:
+            print(f"⚠️ Metadata enrichment failed: {e}")
+            return
+        if track is not self.current_track:
+            self.queue.touch()
+        await self.update_dashboard()
+
+    def schedule_prefetch(self):
+        """(Re)start background resolution of the next queued LazySource entries.
+
+        Must run on the event loop. Entries that left the prefetch window (skip, shuffle,
+        stop) are cancelled; entries already resolving or resolved are left alone.
+        """
+        window = [t for t in self.queue.head(config.PREFETCH_COUNT) if isinstance(t, LazySource)]
+        for track in self.prefetching:
+            if track not in window:
+                track.cancel_prefetch()
+        self.prefetching = window
+        for track in window:
+            track.prefetch(self.bot.loop)
+
+    def cancel_prefetch(self):
+        for track in self.prefetching:
+            track.cancel_prefetch()
+        self.prefetching = []
+
+    def start_ingest(self, ingest):
+        """Stream the rest of a playlist into the queue in the background."""
+        self.ingests.append(ingest)
+        self.bot.loop.create_task(self._run_ingest(ingest))
+
+    async def _run_ingest(self, ingest):
+        async def add_page(page):
+            await self.enqueue(page, announce=False)
+
+        try:
+            await ingest.run(add_page)
+            print(f"📥 [{self.guild_id}] Playlist loaded: {ingest.title} (+{ingest.added} tracks)")
+        except Exception as e:
+            print(f"⚠️ Error loading playlist: {e}")
+            traceback.print_exc()
+        finally:
+            if ingest in self.ingests:
+                self.ingests.remove(ingest)
+            await self.update_dashboard()
+
+    def cancel_ingests(self):
+        for ingest in self.ingests:
+            ingest.cancel()
+        self.ingests = []
+
+    # --- Command processor ---
+    # Only `_run` touches the queue and playback state. Everything else (the cog, playlist
+    # ingests, resolution tasks and discord.py's audio thread) posts commands to it.
+
+    def control(self, name, *args):
+        """Post a user control (skip, stop, shuffle, ...). Never blocks; controls are
+        handled before any pending enqueue. Must be called on the event loop."""
+        try:
+            self._controls.put_nowait((name, args, time.perf_counter()))
+        except asyncio.QueueFull:
+            metrics.inc("lyra_player_commands_dropped_total")
+            print(f"⚠️ [{self.guild_id}] Dropped '{name}': too many pending controls")
+            return
+        self._wake()
+
+    def _post(self, name, *args):
+        """Post an internal event (finished, resolved, ...). Unbounded: losing one would stall playback."""
+        self._events.put_nowait((name, args, time.perf_counter()))
+        self._wake()
+
+    def _post_threadsafe(self, name, *args):
+        self.bot.loop.call_soon_threadsafe(self._post, name, *args)
+
+    async def enqueue(self, tracks, announce=True):
+        """Add tracks to the queue, starting playback if idle. Waits while the enqueue channel is full."""
+        await self._enqueues.put(('enqueue', (list(tracks), announce), time.perf_counter()))
+        self._wake()
+
+    def _wake(self):
+        if self._actor is None or self._actor.done():
+            self._actor = self.bot.loop.create_task(self._run())
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            if not self._events.empty():
+                name, args, posted = self._events.get_nowait()
+            elif not self._controls.empty():
+                name, args, posted = self._controls.get_nowait()
+            elif not self._enqueues.empty():
+                name, args, posted = self._enqueues.get_nowait()
+            else:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            try:
+                await getattr(self, f"_on_{name}")(*args)
+            except Exception as e:
+                print(f"❌ [{self.guild_id}] Error handling '{name}': {e}")
+                traceback.print_exc()
+            metrics.observe("lyra_player_command_seconds", time.perf_counter() - posted, command=name)
+
+    def close(self):
+        """Stop the command processor and the journal; the player is being dropped."""
+        if self._actor:
+            self._actor.cancel()
+        if self.journal:
+            self.journal.close()
+
+    # --- Command handlers (command processor only) ---
+    async def _on_enqueue(self, tracks, announce):
+        if not tracks:
+            return
+        self.queue.extend(tracks)
+        if self.current_track is None and self._starting is None and self.voice_client:
+            self._advance()
+            return
+        if announce:
+            print(f"📚 Added to queue: {tracks[0].title} (Queue size: {len(self.queue)})")
+            self.enrich(tracks[0])
+        self.schedule_prefetch()
+        await self.update_dashboard()
+
+    async def _on_restore(self, state):
+        self.loop_mode = state['loop_mode']
+        self.queue.journal = None # Already on disk
+        self.queue.extend(LazySource(entry, entry.get('requester_id')) for entry in state['queue'])
+        if self.dashboard_channel is None and state['text_channel_id']:
+            self.dashboard_channel = self.bot.get_channel(state['text_channel_id'])
+
+        current = state['current']
+        if current:
+            track = LazySource(current, current.get('requester_id'))
+            if self.voice_client:
+                self.current_track = track
+                self.start_time = time.time() - state['position']
+                self._resolve(track, start_at=state['position'], new_play=False)
+            else:
+                # Nowhere to play it yet; keep it first in line
+                self.queue.appendleft(track)
+        self.queue.journal = self.journal
+        if self.journal:
+            self.journal.compact()
+        print(f"♻️ [{self.guild_id}] Restored {len(self.queue) + bool(current)} tracks")
+        await self.update_dashboard()
+
+    async def _on_resolved(self, track, sources, error):
+        if track is not self._starting:
+            # Skipped or stopped while it was resolving
+            for source in sources or ():
+                source.cleanup()
+            return
+        replacing, self._replacing = self._replacing, None
+        self._starting = None
+        if replacing is not None:
+            if replacing is not self.current_track:
+                # The seeked track finished meanwhile
+                for source in sources or ():
+                    source.cleanup()
+                return
+            # Seek: swap the new stream in; the replaced track's 'finished' is ignored
+            if error:
+                print(f"⚠️ Seek failed: {error}")
+                return
+            was_paused = self.voice_client.is_paused()
+            self.current_track = sources[0]
+            self.voice_client.stop()
+            self._play_track(self.current_track, new_play=False)
+            if was_paused:
+                self.voice_client.pause()
+            return
+        if error:
+            print(f"❌ Error resolving track: {error}")
+            self._advance()
+            return
+        self.current_track = sources[0]
+        self._play_track(self.current_track, new_play=not self._continuing)
+
+    async def _on_finished(self, track, error):
+        if track is not self.current_track:
+            return # Stopped or replaced since; nothing to advance
+
+        if self._stream_died(track, error) and self.resume_attempts < config.STREAM_RESUME_ATTEMPTS:
+            # Fresh stream URL, then an input seek back to where it stopped
+            self.resume_attempts += 1
+            position = track.position
+            print(f"🔁 [{self.guild_id}] Stream ended early at {int(position)}s, resuming (attempt {self.resume_attempts})")
+            resolution_cache.invalidate(canonical_video_id(track.webpage_url or track.url))
+            self._resolve(LazySource(track_entry(track), track.requester_id), start_at=position, new_play=False)
+            return
+
+        if error:
+            print(f"❌ ERROR in after_play: {error}")
+        else:
+            elapsed = time.time() - self.start_time
+            if elapsed < 10 and not self.manual_skip:
+                metrics.inc("lyra_short_track_total")
+                print(f"⚠️ Track finished too quickly ({int(elapsed)}s). Possible playback error or region lock.")
+                self.bot.loop.create_task(self.send_notification(
+                    f"⚠️ **Error:** Track finished too quickly ({int(elapsed)}s). It might be region-locked.",
+                    color=config.COLOR_ERROR,
+                ))
+            else:
+                print("✅ Track finished")
+
+        # Handle Loop
+        if self.loop_mode == 1: # Loop Track
+            if not error and isinstance(track, YTDLSource) and track.can_replay:
+                # Replay from the recorded frames: no extraction, no FFmpeg
+                self.current_track = track.replay()
+                self._play_track(self.current_track, new_play=False)
+                return
+            self._requeue(track, front=True)
+        elif self.loop_mode == 2: # Loop Queue
+            self._requeue(track, front=False)
+
+        self._advance()
+
+    def _stream_died(self, track, error):
+        """True if `track` played for a while, then stopped well short of its duration without
+        anyone asking it to. A stream that fails right away (region lock, 403) is not resumed."""
+        if self.manual_skip or not isinstance(track, YTDLSource) or not track.duration:
+            return False
+        if track.position - track.start_offset < config.STREAM_RESUME_MIN_PLAYED:
+            return False
+        return error is not None or track.position < float(track.duration) - config.STREAM_END_TOLERANCE
+
+    async def _on_seek(self, delta):
+        track = self.current_track
+        if not isinstance(track, YTDLSource) or not self.voice_client or self._starting is not None:
+            return
+        if not (self.voice_client.is_playing() or self.voice_client.is_paused()):
+            return
+        target = max(0, track.position + delta)
+        if track.duration:
+            target = min(target, max(0, float(track.duration) - 1))
+        print(f"⏩ [{self.guild_id}] Seeking to {int(target)}s")
+        # The stream is re-opened at `target` with an input seek; the played part isn't fetched again
+        self._resolve(LazySource(track_entry(track), track.requester_id), start_at=target)
+        self._replacing = track
+
+    async def _on_toggle_pause(self):
+        if not self.voice_client:
+            return
+        if self.voice_client.is_paused():
+            self.voice_client.resume()
+        elif self.voice_client.is_playing():
+            self.voice_client.pause()
+        await self.update_dashboard()
+
+    async def _on_skip(self):
+        if self.voice_client and self.voice_client.is_playing():
+            self.manual_skip = True
+            self.voice_client.stop() # after callback posts 'finished'
+        elif self._starting is not None and self._replacing is None:
+            # Still resolving: drop it and move on
+            self._starting = None
+            self._advance()
+
+    async def _on_stop(self):
+        self.cancel_ingests()
+        self.cancel_prefetch()
+        self.queue.clear()
+        self._starting = None
+        self._replacing = None
+        self.current_track = None
+        self._record('current', track=None)
+        if self.voice_client:
+            self.manual_skip = True
+            self.voice_client.stop()
+            # Do not disconnect, just stop playing. The stopped track's 'finished' is
+            # ignored (it is no longer current), so the idle timer starts here
+            self.bot.loop.create_task(self.start_disconnect_timer())
+        await self.update_dashboard()
+
+    async def _on_cycle_loop(self):
+        # Off -> Track -> Queue -> Off
+        # Turning on loop-track mid-song can't record the part already played: the first
+        # repeat is re-resolved as before, and that play gets recorded for the rest
+        self.loop_mode = (self.loop_mode + 1) % 3
+        self._record('loop', mode=self.loop_mode)
+        await self.update_dashboard()
+
+    async def _on_shuffle(self):
+        if not self.queue:
+            return
+        self.queue.shuffle()
+        self.schedule_prefetch()
+        await self.update_dashboard()
+
+    async def _on_idle_check(self):
+        if self.voice_client and not self.voice_client.is_playing() and not self.queue and self._starting is None:
+            await self.voice_client.disconnect()
+            self.voice_client = None
+            self._record('voice', channel_id=None)
+            print(f"👋 [{self.guild_id}] Disconnected due to inactivity.")
+            await self.send_notification("👋 Left the voice channel due to inactivity.", color=config.COLOR_ERROR)
+            await self.update_dashboard()
+            self.cog.release_player(self)
+
+    # --- Playback (command processor only) ---
+    def _advance(self):
+        """Start the next queued track, or go idle."""
+        print(f"🐛 [{self.guild_id}] Checking queue...")
+
+        if not self.queue:
+            print(f"⏹️ [{self.guild_id}] Queue finished. Starting auto-disconnect timer (3m).")
+            self.current_track = None
+            self._record('current', track=None)
+            self.renderer.request()
+            self.bot.loop.create_task(self.start_disconnect_timer())
+            return
+
+        next_track = self.queue.popleft()
+        self.resume_attempts = 0
+        # The popped entry is now owned by _resolve, keep its prefetch alive
+        if next_track in self.prefetching:
+            self.prefetching.remove(next_track)
+
+        if isinstance(next_track, LazySource):
+            self._resolve(next_track)
+            return
+
+        self.current_track = next_track
+        self._play_track(self.current_track)
+
+    def _resolve(self, track, start_at=0, new_play=True):
+        # Extraction can take seconds, so it runs beside the processor and reports back as 'resolved'
+        self._starting = track
+        self._replacing = None
+        self._continuing = not new_play
+        self.bot.loop.create_task(self._fetch_source(track, start_at))
+
+    async def _fetch_source(self, track, start_at):
+        sources, error = None, None
+        try:
+            # Resolve LazySource to YTDLSource (returns a list, take first)
+            sources = await track.get_source(self.bot.loop, start_at=start_at, bitrate=self.bitrate)
+            if not sources:
+                error = Exception("Resolved source is empty")
+        except Exception as e:
+            traceback.print_exc()
+            error = e
+        self._post('resolved', track, sources, error)
+
+    async def start_disconnect_timer(self):
+        await asyncio.sleep(180) # 3 minutes
+        self._post('idle_check')
+
+    def _play_track(self, track, new_play=True):
+        """Hand `track` to the voice client. `new_play` is False for seeks and loop replays,
+        which continue a listen rather than start one."""
+        self.manual_skip = False
+        # A play resumed mid-track can't be replayed whole
+        if self.loop_mode == 1 and isinstance(track, YTDLSource) and not track.start_offset:
+            track.start_recording()
+        print(f"▶️ [{self.guild_id}] Now Playing: {track.title} ({track.formatted_duration}) | 👤 {track.requester_id}")
+        try:
+            track.play_requested_at = time.perf_counter()
+            # Runs on discord.py's audio thread; hand the event to the command processor
+            self.voice_client.play(track, after=lambda error: self._post_threadsafe('finished', track, error))
+            self.start_time = time.time() - track.start_offset
+            fmt = getattr(track, 'stream_format', None)
+            print(f"🎵 Audio stream started ({fmt['acodec']} {fmt['abr']:.0f}kbps)" if fmt else "🎵 Audio stream started")
+            self._record('current', track=track_entry(track), position=track.start_offset)
+            if new_play and not track.start_offset:
+                # Resumes and restores start mid-track: same listen, not a new play
+                audio_cache.record_play(canonical_video_id(track.webpage_url or track.url), track, self.bot.loop)
+            self.enrich(track)
+        except Exception as e:
+            print(f"❌ ERROR in voice_client.play: {e}")
+            traceback.print_exc()
+            if self.voice_client.is_playing():
+                # Something else is still on the client; advancing would fail the same way
+                track.cleanup()
+                return
+            self._advance() # Skip if error
+            return
+
+        self.renderer.request()
+        # Resolve what comes next while this track plays
+        self.schedule_prefetch()
+
+    def _requeue(self, track, front=True):
+        # Back into the queue as a lightweight entry; it resolves from the caches when its turn comes
+        entry = LazySource(track_entry(track), track.requester_id)
+        if front:
+            self.queue.appendleft(entry)
+        else:
+            self.queue.append(entry)
@@ -0,0 +1,97 @@
+import struct
+import tempfile
+import discord
+
+_LENGTH = struct.Struct('<H') # Frames are at most a few KB, so a 2-byte length prefix is enough
+
+
+class ReplayBuffer:
+    """Bounded record of the frames a track produced, for looping it without FFmpeg or network.
+
+    Frames are kept in memory up to `memory_budget` bytes, then appended to an
+    anonymous spill file up to `spill_budget` more. Past that the buffer marks
+    itself overflowed and the player falls back to re-resolving the track.
+    """
+
+    def __init__(self, is_opus, memory_budget, spill_budget=0):
+        self.is_opus = is_opus
+        self.memory_budget = memory_budget
+        self.spill_budget = spill_budget
+        self._frames = []
+        self._memory_bytes = 0
+        self._spill = None
+        self._spill_bytes = 0
+        self.frame_count = 0
+        self.complete = False
+        self.overflow = False
+
+    def append(self, frame):
+        if self.overflow or self.complete:
+            return
+        size = len(frame)
+        if self._memory_bytes + size <= self.memory_budget and self._spill is None:
+            self._frames.append(frame)
+            self._memory_bytes += size
+        elif self._spill_bytes + size + _LENGTH.size <= self.spill_budget:
+            if self._spill is None:
+                self._spill = tempfile.TemporaryFile(prefix='lyra-replay-')
+            self._spill.write(_LENGTH.pack(size))
+            self._spill.write(frame)
+            self._spill_bytes += size + _LENGTH.size
+        else:
+            self.release()
+            self.overflow = True
+            return
+        self.frame_count += 1
+
+    def finish(self):
+        if not self.overflow:
+            self.complete = True
+            if self._spill is not None:
+                self._spill.flush()
+
+    @property
+    def seconds(self):
+        return self.frame_count * 0.02
+
+    @property
+    def size(self):
+        return self._memory_bytes + self._spill_bytes
+
+    def reader(self):
+        return ReplaySource(self)
+
+    def release(self):
+        self._frames = []
+        self._memory_bytes = 0
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        self._spill_bytes = 0
+
+
+class ReplaySource(discord.AudioSource):
+    """Plays a completed ReplayBuffer back frame by frame."""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self._index = 0
+        self._offset = 0
+
+    def read(self):
+        buffer = self.buffer
+        if self._index < len(buffer._frames):
+            frame = buffer._frames[self._index]
+            self._index += 1
+            return frame
+        spill = buffer._spill
+        if spill is None or self._offset >= buffer._spill_bytes:
+            return b''
+        spill.seek(self._offset)
+        (size,) = _LENGTH.unpack(spill.read(_LENGTH.size))
+        frame = spill.read(size)
+        self._offset += _LENGTH.size + size
+        return frame
+
+    def is_opus(self):
+        return self.buffer.is_opus
@@ -0,0 +1,256 @@
+import asyncio
+import functools
+import re
+import sqlite3
+import config
+from utils.audio import YTDLSource, LazySource, extraction_pool
+from utils.extractor import PRIORITY_PLAY, PRIORITY_BACKGROUND
+from utils.metadata_cache import MetadataCache
+from utils.metrics import metrics
+
+SPOTIFY_URL_RE = re.compile(r'open\.spotify\.com/(?:intl-[a-z]+/)?(track|album|playlist)/([A-Za-z0-9]+)')
+
+PLAYLIST_FIELDS = 'items(track(id,name,duration_ms,artists(name),album(images))),next'
+
+# Spotify track ID -> matched YouTube video (or a cached "no match"), shared with the metadata store
+match_cache = MetadataCache(
+    config.METADATA_CACHE_PATH,
+    hit_ttl=config.SPOTIFY_MATCH_TTL,
+    miss_ttl=config.METADATA_CACHE_MISS_TTL,
+    table='spotify_matches',
+)
+metrics.add_collector("lyra_spotify_match_cache", "Spotify to YouTube match cache counters", match_cache.stats)
+
+
+def parse_spotify_url(url):
+    """Return (kind, id) for a Spotify track/album/playlist link, or None."""
+    match = SPOTIFY_URL_RE.search(url)
+    return (match.group(1), match.group(2)) if match else None
+
+
+def _normalize_track(item, images=None):
+    images = (item.get('album') or {}).get('images') or images or []
+    return {
+        'id': item.get('id'),
+        'name': item.get('name'),
+        'artists': ", ".join(artist['name'] for artist in item.get('artists', []) if artist.get('name')),
+        'duration': (item.get('duration_ms') or 0) / 1000 or None,
+        'thumbnail': images[0]['url'] if images else None,
+    }
+
+
+class SpotifyClient:
+    """Async wrapper around spotipy; the blocking calls run on the default executor.
+
+    The API and token endpoints come from config, so a local mock of the Web API
+    can stand in for Spotify.
+    """
+
+    def __init__(self):
+        self._sp = None
+
+    def _client(self):
+        if self._sp is None:
+            if not (config.SPOTIFY_CLIENT_ID and config.SPOTIFY_CLIENT_SECRET):
+                raise Exception("Spotify links need SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET in .env")
+            import spotipy
+            from spotipy.cache_handler import MemoryCacheHandler
+            from spotipy.oauth2 import SpotifyClientCredentials
+
+            # Keep the token in memory; the default handler writes it to ./.cache
+            auth = SpotifyClientCredentials(
+                client_id=config.SPOTIFY_CLIENT_ID,
+                client_secret=config.SPOTIFY_CLIENT_SECRET,
+                cache_handler=MemoryCacheHandler(),
+            )
+            auth.OAUTH_TOKEN_URL = config.SPOTIFY_TOKEN_URL
+            self._sp = spotipy.Spotify(auth_manager=auth, requests_timeout=config.HTTP_TIMEOUT)
+            self._sp.prefix = config.SPOTIFY_API_URL
+        return self._sp
+
+    async def _call(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(getattr(self._client(), method), *args, **kwargs))
+
+    async def track(self, track_id):
+        return _normalize_track(await self._call('track', track_id))
+
+    async def title(self, kind, spotify_id):
+        if kind == 'playlist':
+            data = await self._call('playlist', spotify_id, fields='name')
+        else:
+            data = await self._call('album', spotify_id)
+        return data.get('name')
+
+    async def pages(self, kind, spotify_id):
+        """Yield the tracks of an album or playlist one API page (50-100 tracks) at a time."""
+        images = None
+        if kind == 'playlist':
+            page = await self._call('playlist_items', spotify_id, fields=PLAYLIST_FIELDS, limit=100, additional_types=('track',))
+        else:
+            album = await self._call('album', spotify_id)
+            images = album.get('images')
+            page = await self._call('album_tracks', spotify_id, limit=50)
+
+        while page:
+            items = page.get('items', [])
+            if kind == 'playlist':
+                items = [item.get('track') for item in items]
+            yield [_normalize_track(item, images) for item in items if item and item.get('id')]
+            page = await self._call('next', page) if page.get('next') else None
+
+
+spotify = SpotifyClient()
+
+
+async def _match_cache_call(method, *args):
+    """Run a match_cache call off the event loop. A locked or broken store counts as a miss."""
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, getattr(match_cache, method), *args)
+    except sqlite3.Error as e:
+        print(f"⚠️ Spotify match cache {method} failed: {e}")
+        return (False, None) if method == 'get' else None
+
+
+async def match_track(track, priority=PRIORITY_BACKGROUND):
+    """Find the YouTube video for a Spotify track. Cached by Spotify track ID, misses included."""
+    found, match = await _match_cache_call('get', track['id'])
+    if found:
+        return match
+
+    query = f"ytsearch1:{track['artists']} - {track['name']}"
+    data = await extraction_pool.extract(query, process=False, page_size=1, priority=priority)
+    pager = (data or {}).pop('_pager', None)
+    if pager:
+        extraction_pool.close_pager(pager)
+
+    entries = (data or {}).get('entries') or []
+    match = None
+    if entries and entries[0].get('id'):
+        video_id = entries[0]['id']
+        match = {'id': video_id, 'url': f"https://www.youtube.com/watch?v={video_id}"}
+    await _match_cache_call('put', track['id'], match)
+    return match
+
+
+def _lazy_entry(track, match):
+    return {
+        'url': match['url'],
+        'webpage_url': match['url'],
+        'title': f"{track['artists']} - {track['name']}" if track['artists'] else track['name'],
+        'duration': track['duration'],
+        'uploader': track['artists'],
+        'thumbnail': track['thumbnail'],
+    }
+
+
+class SpotifyIngest:
+    """Matches the rest of a Spotify album/playlist to YouTube and streams it into the queue.
+
+    Same interface as PlaylistIngest. Tracks are matched concurrently (at most
+    SPOTIFY_MATCH_CONCURRENCY searches in flight) and added in playlist order,
+    one chunk at a time.
+    """
+
+    def __init__(self, kind, spotify_id, first_tracks, pages, requester_id):
+        self.kind = kind
+        self.spotify_id = spotify_id
+        self.first_tracks = first_tracks
+        self.pages = pages
+        self.requester_id = requester_id
+        self.title = f"Spotify {kind}"
+        self.added = 0
+        self.missing = 0
+        self.cancelled = False
+        self.done = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    async def _set_title(self):
+        try:
+            self.title = await spotify.title(self.kind, self.spotify_id) or self.title
+        except Exception as e:
+            print(f"⚠️ Could not read Spotify {self.kind} name: {e}")
+
+    async def run(self, on_page):
+        semaphore = asyncio.Semaphore(config.SPOTIFY_MATCH_CONCURRENCY)
+        chunk_size = config.SPOTIFY_MATCH_CONCURRENCY * 2
+        asyncio.ensure_future(self._set_title())
+
+        async def match(track):
+            async with semaphore:
+                return await match_track(track, PRIORITY_BACKGROUND)
+
+        async def add(tracks):
+            for start in range(0, len(tracks), chunk_size):
+                if self.cancelled:
+                    return
+                chunk = tracks[start:start + chunk_size]
+                matches = await asyncio.gather(*(match(track) for track in chunk), return_exceptions=True)
+                page = []
+                for track, found in zip(chunk, matches):
+                    if isinstance(found, Exception) or not found:
+                        self.missing += 1
+                        continue
+                    page.append(LazySource(_lazy_entry(track, found), self.requester_id))
+                if page and not self.cancelled:
+                    self.added += len(page)
+                    await on_page(page)
+
+        try:
+            await add(self.first_tracks)
+            self.first_tracks = None
+            async for tracks in self.pages:
+                if self.cancelled:
+                    break
+                await add(tracks)
+        finally:
+            await self.pages.aclose()
+            self.done = True
+
+
+async def create_spotify_source(url, *, requester_id=None, on_ingest=None, bitrate=None):
+    """Spotify counterpart of YTDLSource.create_source.
+
+    The first matchable track is resolved and returned right away; the rest of
+    an album or playlist goes to `on_ingest` as a SpotifyIngest (or is read in
+    full before returning when no callback is given).
+    """
+    kind, spotify_id = parse_spotify_url(url)
+
+    if kind == 'track':
+        track = await spotify.track(spotify_id)
+        match = await match_track(track, PRIORITY_PLAY)
+        if not match:
+            raise Exception(f"Could not find `{track['name']}` on YouTube")
+        return await YTDLSource.create_source(match['url'], requester_id=requester_id, bitrate=bitrate)
+
+    pages = spotify.pages(kind, spotify_id)
+    sources = None
+    tracks = []
+    try:
+        async for tracks in pages:
+            # Match in order until one plays; those before it had no YouTube match
+            while tracks and sources is None:
+                track = tracks.pop(0)
+                match = await match_track(track, PRIORITY_PLAY)
+                if match:
+                    sources = await YTDLSource.create_source(match['url'], requester_id=requester_id, bitrate=bitrate)
+            if sources is not None:
+                break
+    except BaseException:
+        await pages.aclose()
+        raise
+
+    if sources is None:
+        raise Exception("Could not find any of these Spotify tracks on YouTube")
+
+    ingest = SpotifyIngest(kind, spotify_id, tracks, pages, requester_id)
+    if on_ingest:
+        on_ingest(ingest)
+    else:
+        async def collect(page):
+            sources.extend(page)
+        await ingest.run(collect)
+    return sources
@@ -0,0 +1,107 @@
+import random
+import itertools
+from collections import deque
+
+
+def _seconds(track):
+    return int(track.duration) if track.duration else 0
+
+
+class TrackQueue:
+    """Play queue with O(1) head/tail operations and a running total duration.
+
+    `revision` changes on every mutation, so renderers can cache anything derived
+    from the queue (like the "Up Next" block) until it actually changes. If a
+    `journal` is attached, every mutation is also reported to it.
+    """
+
+    def __init__(self, tracks=()):
+        self._items = deque()
+        self.total_duration = 0
+        self.revision = 0
+        self.journal = None
+        self.extend(tracks)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __bool__(self):
+        return bool(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __contains__(self, track):
+        return track in self._items
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self._items))
+            return list(itertools.islice(self._items, start, stop, step))
+        return self._items[index]
+
+    def head(self, n):
+        """First `n` tracks, without walking the rest of the queue."""
+        return list(itertools.islice(self._items, n))
+
+    def _changed(self, op=None, tracks=()):
+        self.revision += 1
+        if self.journal is not None and op:
+            self.journal.queue_changed(op, tracks)
+
+    def touch(self):
+        """Signal that a queued track changed in place (e.g. its title was enriched)."""
+        self._changed()
+
+    def append(self, track):
+        self._items.append(track)
+        self.total_duration += _seconds(track)
+        self._changed('extend', (track,))
+
+    def extend(self, tracks):
+        tracks = list(tracks)
+        for track in tracks:
+            self._items.append(track)
+            self.total_duration += _seconds(track)
+        self._changed('extend', tracks)
+
+    def appendleft(self, track):
+        self._items.appendleft(track)
+        self.total_duration += _seconds(track)
+        self._changed('appendleft', (track,))
+
+    def popleft(self):
+        track = self._items.popleft()
+        self.total_duration -= _seconds(track)
+        self._changed('popleft')
+        return track
+
+    def clear(self):
+        self._items.clear()
+        self.total_duration = 0
+        self._changed('clear')
+
+    def shuffle(self):
+        items = list(self._items)
+        random.shuffle(items)
+        self._items = deque(items)
+        self._changed('reorder')
+
+    def remove_at(self, index):
+        track = self._items[index]
+        del self._items[index]
+        self.total_duration -= _seconds(track)
+        self._changed('reorder')
+        return track
+
+    def remove(self, track):
+        self._items.remove(track)
+        self.total_duration -= _seconds(track)
+        self._changed('reorder')
+
+    def move(self, src, dst):
+        """Move the track at position `src` to position `dst`."""
+        track = self._items[src]
+        del self._items[src]
+        self._items.insert(dst, track)
+        self._changed('reorder')